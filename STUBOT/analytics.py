@@ -0,0 +1,126 @@
+# analytics.py
+from datetime import datetime, timedelta
+
+from peewee import fn
+
+from model import EPOCH, ChartData, UnansweredQuestion
+
+# Series are zero-filled and capped, so a response has at most this many
+# points however much history is kept
+MAX_SPAN = {"hour": 7 * 24, "day": 366}
+MAX_LIMIT = 50
+
+
+def utc_iso(ts):
+    """ISO 8601 for a naive UTC timestamp, marked as UTC for browsers."""
+    return ts.isoformat() + "Z"
+
+
+def bucket_start(ts, bucket):
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def buckets(bucket, span, now=None):
+    """The last `span` bucket starts (capped at MAX_SPAN), oldest first."""
+    span = max(1, min(span, MAX_SPAN[bucket]))
+    step = timedelta(hours=1) if bucket == "hour" else timedelta(days=1)
+    last = bucket_start(now or datetime.utcnow(), bucket)
+    return [last - step * i for i in range(span - 1, -1, -1)]
+
+
+def _counter_series(names, starts):
+    """{name: {bucket start: value}} for counters in the given buckets."""
+    series = {name: {} for name in names}
+    query = ChartData.select(
+        ChartData.metric_name, ChartData.timestamp, ChartData.value
+    ).where(
+        ChartData.metric_name.in_(names),
+        ChartData.timestamp.between(starts[0], starts[-1]),
+    )
+    for row in query:
+        series[row.metric_name][row.timestamp] = row.value
+    return series
+
+
+def queries_series(bucket="day", span=30, now=None):
+    """Queries, answered and unanswered per bucket for the last `span` buckets."""
+    starts = buckets(bucket, span, now)
+    names = [f"queries_{bucket}", f"answered_{bucket}", f"unanswered_{bucket}"]
+    series = _counter_series(names, starts)
+    return [
+        {
+            "bucket": utc_iso(start),
+            "queries": series[names[0]].get(start, 0),
+            "answered": series[names[1]].get(start, 0),
+            "unanswered": series[names[2]].get(start, 0),
+        }
+        for start in starts
+    ]
+
+
+def answer_rate_series(bucket="day", span=30, now=None):
+    """Share of queries answered per bucket; None where there were no queries."""
+    return [
+        {
+            "bucket": point["bucket"],
+            "queries": point["queries"],
+            "answer_rate": (
+                point["answered"] / point["queries"] if point["queries"] else None
+            ),
+        }
+        for point in queries_series(bucket, span, now)
+    ]
+
+
+def top_intents(limit=10, days=None, now=None):
+    """Most frequent intents, all time or over the last `days` days."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    if days is None:
+        query = (
+            ChartData.select(ChartData.metric_name, ChartData.value.alias("count"))
+            .where(
+                ChartData.metric_name.startswith("intent:"),
+                ChartData.timestamp == EPOCH,
+            )
+            .order_by(ChartData.value.desc())
+        )
+        prefix = "intent:"
+    else:
+        starts = buckets("day", days, now)
+        total = fn.SUM(ChartData.value)
+        query = (
+            ChartData.select(ChartData.metric_name, total.alias("count"))
+            .where(
+                ChartData.metric_name.startswith("intent_day:"),
+                ChartData.timestamp >= starts[0],
+            )
+            .group_by(ChartData.metric_name)
+            .order_by(total.desc())
+        )
+        prefix = "intent_day:"
+    return [
+        {"intent": row["metric_name"][len(prefix) :], "count": row["count"]}
+        for row in query.limit(limit).dicts()
+        if row["count"] > 0
+    ]
+
+
+def top_unanswered(limit=10):
+    """Questions the bot most often failed to answer."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    query = (
+        UnansweredQuestion.select()
+        .where(UnansweredQuestion.count > 0)
+        .order_by(UnansweredQuestion.count.desc(), UnansweredQuestion.last_seen.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "question": row.example,
+            "count": row.count,
+            "last_seen": utc_iso(row.last_seen),
+        }
+        for row in query
+    ]
@@ -10,23 +10,62 @@ from flask import (
     redirect,
     flash,
     session,
+    Response,
+    stream_with_context,
+    g,
 )
 from werkzeug.security import check_password_hash
+from peewee import Tuple
 from playhouse.flask_utils import object_list
 from datetime import datetime
 import requests
 import os, json
-from gtts import gTTS  # Google Text-to-Speech library
+from tts_backends import make_backend
+from tts_cache import TTSCache
+from audio_store import AudioStore, AudioTooLarge, upload_ext
+from transcode import compress_voice, ffmpeg_available
+from presynth import load_manifest
+from background import BackgroundJobs
+from rasa_client import RasaClient, RasaUnavailable
+from response_cache import ResponseCache
+from domain import single_turn_texts, load_responses
+from faq_index import FaqIndex
+from log_writer import LogWriter
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from profiler import SamplingProfiler
+import analytics
+import export
+import search
+import retention
+import atexit
+import threading
+import time
 from model import (
     db,
+    write_transaction,
     ChatLog,
     ChartData,
     initialize_db,
     User,
+    record_chats,
+    bump_counters,
+    get_counters,
+    encode_cursor,
+    decode_cursor,
+    parse_utc,
+    search_enabled,
+    STATUS_ANSWERED,
+    STATUS_ANSWERED_LOCALLY,
+    STATUS_FALLBACK,
+    STATUS_RASA_UNAVAILABLE,
+    STATUS_ERROR,
 )  # Import Peewee models and init function
 
 # Initialize Flask app
 app = Flask(__name__)
+# Set here rather than under __main__ so the app also works when served by
+# a WSGI/ASGI server (see asgi.py)
+app.secret_key = os.environ.get("SECRET_KEY", "Lc6AI3fIZpFUrJjWE33")
 
 
 @app.context_processor
@@ -39,16 +78,284 @@ def utility_processor():
 with app.app_context():
     initialize_db()
 
+
+# One connection per request, closed when the request ends. Background
+# threads (log writer, TTS jobs) keep their own thread-local connection.
+@app.before_request
+def open_db_connection():
+    # Flask's own "static" endpoint is the one that matches /static/ URLs
+    if request.endpoint not in (
+        "static",
+        "static_files",
+        "audio_file",
+        "metrics_endpoint",
+    ):
+        db.connect(reuse_if_open=True)
+
+
+@app.teardown_request
+def close_db_connection(exc):
+    if not db.is_closed():
+        db.close()
+
+
+# --- Metrics ---
+# Prometheus text format on /metrics (see metrics.py). Set METRICS_TOKEN
+# to require "Authorization: Bearer <token>" from the scraper.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+metrics = Registry()
+http_requests = metrics.counter(
+    "stubot_http_requests_total",
+    "HTTP requests by endpoint, method and status.",
+    ("endpoint", "method", "status"),
+)
+http_seconds = metrics.histogram(
+    "stubot_http_request_duration_seconds",
+    "Time to handle a request, by endpoint.",
+    ("endpoint", "method"),
+)
+chat_stage_seconds = metrics.histogram(
+    "stubot_chat_stage_seconds",
+    "Time spent in each stage of a chat "
+    "(upload, faq_fastpath, rasa, faq_fallback, tts, transcode, intent, db_write).",
+    ("stage",),
+)
+chat_outcomes = metrics.counter(
+    "stubot_chats_total", "Chat messages by logged status.", ("status",)
+)
+rasa_errors = metrics.counter(
+    "stubot_rasa_errors_total", "Failed Rasa calls from /chat, by kind.", ("kind",)
+)
+bot_audio_sources = metrics.counter(
+    "stubot_bot_audio_total",
+    "Where the audio for a bot reply came from (manifest, cache, synthesized).",
+    ("source",),
+)
+
+# Sampling profiler for hot-path investigations, off unless PROFILER=1;
+# toggle it at runtime from /admin/profiler
+profiler = SamplingProfiler(
+    interval=float(os.environ.get("PROFILER_INTERVAL_MS", "10")) / 1000
+)
+if os.environ.get("PROFILER") == "1":
+    profiler.start()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unmatched"
+    http_requests.inc(
+        endpoint=endpoint, method=request.method, status=response.status_code
+    )
+    if "request_start" in g:
+        http_seconds.observe(
+            time.perf_counter() - g.request_start,
+            endpoint=endpoint,
+            method=request.method,
+        )
+    return response
+
+
 # --- Configuration for Rasa and TTS ---
 
-RASA_SERVER_URL = "http://localhost:5005/webhooks/rest/webhook"
+RASA_SERVER_URL = os.environ.get(
+    "RASA_SERVER_URL", "http://localhost:5005/webhooks/rest/webhook"
+)
 # RASA_SERVER_URL = "http://localhost:5005/webhooks/rest/webhook" # Default Rasa server URL
+RASA_UNAVAILABLE_MESSAGE = (
+    "Sorry, the chatbot service is currently unavailable. Please try again later."
+)
+
+# One pooled keep-alive client for all requests, with timeouts and a
+# circuit breaker so a hung Rasa server cannot tie up Flask workers.
+rasa_client = RasaClient(
+    RASA_SERVER_URL,
+    connect_timeout=float(os.environ.get("RASA_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.environ.get("RASA_READ_TIMEOUT", "10")),
+    parse_timeout=float(os.environ.get("RASA_PARSE_TIMEOUT", "2")),
+    retries=int(os.environ.get("RASA_RETRIES", "2")),
+    pool_size=int(os.environ.get("RASA_POOL_SIZE", "20")),
+    failure_threshold=int(os.environ.get("RASA_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.environ.get("RASA_BREAKER_RESET", "30")),
+)
+
+# Repeated single-turn FAQ questions are answered from memory. The cache is
+# flushed whenever Rasa reports a different model than the one that filled it.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") == "1"
+RASA_MODEL_CHECK_SECONDS = float(os.environ.get("RASA_MODEL_CHECK_SECONDS", "60"))
+response_cache = ResponseCache(
+    single_turn_texts("domain.yml"),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "5000")),
+)
+
+
+def watch_rasa_model():
+    while True:
+        response_cache.check_model(rasa_client.model_fingerprint())
+        time.sleep(RASA_MODEL_CHECK_SECONDS)
+
+
+if RESPONSE_CACHE_ENABLED:
+    threading.Thread(target=watch_rasa_model, daemon=True).start()
+
+# In-process retrieval over domain responses (and data/nlu.yml if present).
+# It answers when Rasa is unreachable, and when FAQ_FASTPATH_THRESHOLD is
+# set it answers confident matches without calling Rasa at all.
+faq_index = FaqIndex("domain.yml")
+
+# Rasa's reply when it didn't understand (logged as status "fallback")
+FALLBACK_TEXTS = set(load_responses("domain.yml").get("utter_fallback", []))
+# Ask Rasa's /model/parse for the intent/confidence of messages it answered
+RASA_FETCH_INTENT = os.environ.get("RASA_FETCH_INTENT", "1") == "1"
+# Off-topic questions ("what is the weather like today") score up to ~0.5
+# against domain.yml; check /admin/faq-index agreement before lowering it
+FAQ_FALLBACK_THRESHOLD = float(os.environ.get("FAQ_FALLBACK_THRESHOLD", "0.6"))
+FAQ_FASTPATH_THRESHOLD = (
+    float(os.environ["FAQ_FASTPATH_THRESHOLD"])
+    if os.environ.get("FAQ_FASTPATH_THRESHOLD")
+    else None
+)
 AUDIO_FOLDER = "static/audio"  # Folder to save generated audio files
 
 # Create audio folder if it doesn't exist
 if not os.path.exists(AUDIO_FOLDER):
     os.makedirs(AUDIO_FOLDER)
 
+# Audio is stored under sharded content-hash names and served from /audio.
+# Behind Apache/lighttpd set AUDIO_X_SENDFILE=1; behind nginx set
+# AUDIO_ACCEL_REDIRECT to an internal location aliased to this folder.
+audio_store = AudioStore(
+    AUDIO_FOLDER, accel_prefix=os.environ.get("AUDIO_ACCEL_REDIRECT") or None
+)
+app.config["USE_X_SENDFILE"] = os.environ.get("AUDIO_X_SENDFILE") == "1"
+
+# Voice uploads are capped (VOICE_MAX_MB) and the whole request with them,
+# so Flask rejects oversized bodies with 413 before reading them
+VOICE_MAX_BYTES = int(float(os.environ.get("VOICE_MAX_MB", "5")) * 1024 * 1024)
+app.config["MAX_CONTENT_LENGTH"] = VOICE_MAX_BYTES + 64 * 1024
+if not ffmpeg_available():
+    print("ffmpeg not found: voice uploads will be stored without transcoding.")
+
+# Bot replies come from a fixed set of domain responses, so synthesized
+# audio is cached by content instead of being regenerated on every message.
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024
+# TTS_BACKEND=espeak synthesizes offline in a pool of TTS_WORKERS processes
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "gtts")
+tts_backend = make_backend(
+    TTS_BACKEND,
+    workers=int(os.environ.get("TTS_WORKERS", "0")) or None,
+    voice=os.environ.get("TTS_VOICE"),
+)
+atexit.register(tts_backend.close)
+tts_cache = TTSCache(AUDIO_FOLDER, max_bytes=TTS_CACHE_MAX_BYTES, backend=tts_backend)
+
+# Audio pre-rendered for every domain.yml response (see presynth.py)
+tts_manifest = load_manifest(AUDIO_FOLDER, tts_backend.name)
+tts_cache.pin(tts_manifest.values())
+
+
+def write_chat_logs(logs):
+    with chat_stage_seconds.time(stage="db_write"):
+        if not db.is_closed():
+            # Written inline on a request thread: use the request's connection
+            record_chats(logs)
+            return
+        # The flusher takes a connection per batch and hands it back: one
+        # held between batches goes stale (MariaDB's wait_timeout) unnoticed
+        with db.connection_context():
+            record_chats(logs)
+
+
+# Chat logs are written behind the request in batched transactions.
+# LOG_QUEUE_POLICY decides what happens when the queue is full:
+# "sync" writes inline, "block" waits briefly then drops, "drop" drops.
+LOG_QUEUE_POLICY = os.environ.get("LOG_QUEUE_POLICY", "sync")
+log_writer = LogWriter(
+    write_chat_logs,
+    max_queue=int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+    batch_size=int(os.environ.get("LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.environ.get("LOG_FLUSH_MS", "50")) / 1000,
+    policy=LOG_QUEUE_POLICY,
+)
+atexit.register(log_writer.close)
+
+# Async mode: return the text reply first, synthesize and log in background.
+# Chats still waiting for TTS, a transcode or their intent are logged from
+# these jobs, so a full background queue gets LOG_QUEUE_POLICY as well.
+CHAT_ASYNC_AUDIO = os.environ.get("CHAT_ASYNC_AUDIO", "1") == "1"
+background = BackgroundJobs(
+    max_workers=int(os.environ.get("CHAT_BACKGROUND_WORKERS", "4")),
+    max_pending=int(os.environ.get("CHAT_BACKGROUND_QUEUE", "1000")),
+    policy=LOG_QUEUE_POLICY,
+)
+
+# Counters the components keep themselves, read when /metrics is scraped
+metrics.collect(
+    "stubot_tts_cache",
+    tts_cache.stats,
+    counters=("hits", "misses", "evictions", "errors"),
+    gauges=("entries", "bytes", "max_bytes"),
+)
+metrics.collect(
+    "stubot_response_cache",
+    response_cache.stats,
+    counters=("hits", "misses", "invalidations"),
+    gauges=("entries",),
+)
+metrics.collect(
+    "stubot_rasa_client",
+    rasa_client.stats,
+    counters=("calls", "errors", "rejected"),
+    gauges=("max_seconds",),
+)
+metrics.collect(
+    "stubot_log_writer",
+    log_writer.stats,
+    counters=("enqueued", "written", "written_sync", "dropped", "failed", "batches"),
+    gauges=("queue_depth", "max_flush_seconds"),
+)
+metrics.collect(
+    "stubot_background",
+    background.stats,
+    counters=("ran_inline", "dropped"),
+    gauges=("pending", "max_pending"),
+)
+
+# Retention: with RETENTION_DAYS set, logs older than that are purged
+# (and archived to RETENTION_ARCHIVE_FOLDER if set) every
+# RETENTION_INTERVAL_HOURS. Every worker schedules passes, but a lock file
+# (retention.LOCK_FILE) lets only one run at a time. See retention.py for
+# running it by hand or from cron instead.
+RETENTION_DAYS = (
+    float(os.environ["RETENTION_DAYS"]) if os.environ.get("RETENTION_DAYS") else None
+)
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", "24"))
+
+
+def run_retention():
+    while True:
+        try:
+            result = retention.run(
+                RETENTION_DAYS,
+                audio_folder=AUDIO_FOLDER,
+                archive_folder=os.environ.get("RETENTION_ARCHIVE_FOLDER"),
+            )
+            if result and (result["deleted"] or result["orphans_removed"]):
+                print(f"Retention: {result}")
+        except Exception as e:
+            print(f"Error running retention job: {e}")
+        time.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+
+if RETENTION_DAYS is not None:
+    threading.Thread(target=run_retention, name="retention", daemon=True).start()
+
 # --- Routes ---
 # Admin Login
 from functools import wraps
@@ -100,69 +407,150 @@ def admin_login():
 @app.route("/dashboard")
 @login_required
 def admin_dashboard():
-    unanswered = [
-        "Sorry, the chatbot service is currently unavailable.",
-        "Sorry, I couldn't get a response from the bot.",
-    ]
-    total_questions = ChatLog.select().count()
-    unanswered_questions = (
-        ChatLog.select().where(ChatLog.bot_response.in_(unanswered)).count()
-    )
-    answered_questions = (
-        ChatLog.select().where(ChatLog.bot_response.not_in(unanswered)).count()
-    )
+    # Counters are maintained on every insert (see model.bump_counters)
+    counts = get_counters()
 
     return render_template(
         "admin-dashboard.html",
-        answered_questions=answered_questions,
-        total_questions=total_questions,
-        unanswered_questions=unanswered_questions,
+        answered_questions=counts["answered"],
+        total_questions=counts["total"],
+        unanswered_questions=counts["unanswered"],
     )
 
 
 @app.route("/admin/chatlogs")
 @login_required
 def chat_logs():
-    """Chat logs with improved minimal pagination"""
-    page = request.args.get("page", 1, type=int)
+    """
+    Chat logs, newest first, with keyset pagination on (timestamp, id).
+    `before` pages to older records and `after` back to newer ones, so
+    every page is an index range scan however deep it is.
+    """
     per_page = 10
+    page = max(1, request.args.get("page", 1, type=int))  # display only
+    q = request.args.get("q", "").strip()
+    if q and search_enabled():
+        return search_chat_logs(q, per_page, page)
+    before = decode_cursor(request.args.get("before"))
+    after = decode_cursor(request.args.get("after"))
 
-    # Ensure page is at least 1
-    page = max(1, page)
-
-    # Get total count
-    total_count = ChatLog.select().count()
+    query = ChatLog.select()
+    if after:
+        ts, log_id = after
+        # A row-value comparison, unlike the equivalent OR, is a range on
+        # the (timestamp, id) index
+        query = query.where(
+            Tuple(ChatLog.timestamp, ChatLog.id) > Tuple(ts, log_id)
+        ).order_by(ChatLog.timestamp.asc(), ChatLog.id.asc())
+    else:
+        if before:
+            ts, log_id = before
+            query = query.where(
+                Tuple(ChatLog.timestamp, ChatLog.id) < Tuple(ts, log_id)
+            )
+        query = query.order_by(ChatLog.timestamp.desc(), ChatLog.id.desc())
 
-    # Calculate total pages
-    total_pages = max(1, (total_count + per_page - 1) // per_page)
+    # One extra row tells us whether there is another page in that direction
+    chatlogs = list(query.limit(per_page + 1))
+    more = len(chatlogs) > per_page
+    chatlogs = chatlogs[:per_page]
+    if after:
+        chatlogs.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = before is not None, more
+    if not after and not before:
+        page = 1
 
-    # Ensure page doesn't exceed total pages
-    page = min(page, total_pages)
+    # Total comes from the rollup counters rather than a COUNT(*) scan
+    counts = get_counters()
+    total_count = counts["total"] - counts["purged"]
+    start_record = ((page - 1) * per_page) + 1 if chatlogs else 0
+    end_record = start_record + len(chatlogs) - 1 if chatlogs else 0
 
-    # Get paginated results
-    chatlogs = (
-        ChatLog.select().order_by(ChatLog.timestamp.desc()).paginate(page, per_page)
+    return render_template(
+        "chatlogs.html",
+        chatlogs=chatlogs,
+        q=None,
+        search_available=search_enabled(),
+        page=page,
+        per_page=per_page,
+        total_count=total_count,
+        has_prev=has_prev,
+        has_next=has_next,
+        prev_cursor=encode_cursor(chatlogs[0]) if chatlogs else None,
+        next_cursor=encode_cursor(chatlogs[-1]) if chatlogs else None,
+        start_record=start_record,
+        end_record=end_record,
     )
 
-    # Calculate has_next more accurately
-    has_prev = page > 1
-    has_next = page < total_pages
 
-    # Calculate record range for display
-    start_record = ((page - 1) * per_page) + 1 if total_count > 0 else 0
-    end_record = min(page * per_page, total_count)
+def search_chat_logs(q, per_page, page):
+    """Full-text search results for the chat log page, best match first."""
+    before = search.decode_rank_cursor(request.args.get("before"))
+    after = search.decode_rank_cursor(request.args.get("after"))
+    try:
+        chatlogs, more = search.search_logs(q, per_page, before, after)
+    except search.SearchError as e:
+        print(f"Error searching chat logs for {q!r}: {e}")
+        chatlogs, more = [], False
+    if after:
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = before is not None, more
+    if not after and not before:
+        page = 1
+    start_record = ((page - 1) * per_page) + 1 if chatlogs else 0
 
     return render_template(
         "chatlogs.html",
         chatlogs=chatlogs,
+        q=q,
+        search_available=True,
         page=page,
         per_page=per_page,
-        total_count=total_count,
-        total_pages=total_pages,
+        total_count=None,  # counting every match would defeat the ranking limit
         has_prev=has_prev,
         has_next=has_next,
+        prev_cursor=search.encode_rank_cursor(chatlogs[0]) if chatlogs else None,
+        next_cursor=search.encode_rank_cursor(chatlogs[-1]) if chatlogs else None,
         start_record=start_record,
-        end_record=end_record,
+        end_record=start_record + len(chatlogs) - 1 if chatlogs else 0,
+    )
+
+
+@app.route("/admin/chatlogs/export")
+@login_required
+def export_chat_logs():
+    """
+    Stream chat logs oldest first as CSV or JSONL (`format`), optionally
+    limited to [`start`, `end`) (ISO 8601, UTC unless an offset is given)
+    and gzip-compressed (`gzip=1`). Every row carries a cursor; pass the
+    last one received as `after` to resume.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return jsonify({"error": "format must be 'csv' or 'jsonl'"}), 400
+    try:
+        start, end = (
+            (parse_utc(request.args[name]) if request.args.get(name) else None)
+            for name in ("start", "end")
+        )
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates"}), 400
+    after = None
+    if request.args.get("after"):
+        after = decode_cursor(request.args["after"])
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+    compress = request.args.get("gzip") == "1"
+
+    filename = f"chatlogs.{fmt}" + (".gz" if compress else "")
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(export.export_logs(fmt, start, end, after, compress)),
+        mimetype="application/gzip" if compress else mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
@@ -174,6 +562,18 @@ def chat_logs():
 #         print(chat)
 #         ChatLog.delete_by_id(chat_id)
 #     return redirect(url_for(chat_logs))
+def audio_in_use(filename):
+    """True if any chat log still refers to the stored audio filename."""
+    return (
+        ChatLog.select()
+        .where(
+            (ChatLog.user_audio_filename == filename)
+            | (ChatLog.bot_audio_filename == filename)
+        )
+        .exists()
+    )
+
+
 @app.route("/admin/delete-chat-log/<int:log_id>")
 @login_required
 def delete_chat_log(log_id):
@@ -181,18 +581,27 @@ def delete_chat_log(log_id):
     try:
         log = ChatLog.get_by_id(log_id)
 
-        # Delete audio files if they exist
-        if log.user_audio_filename and os.path.exists(
-            os.path.join(AUDIO_FOLDER, log.user_audio_filename)
-        ):
-            os.remove(os.path.join(AUDIO_FOLDER, log.user_audio_filename))
-        if log.bot_audio_filename and os.path.exists(
-            os.path.join(AUDIO_FOLDER, log.bot_audio_filename)
-        ):
-            os.remove(os.path.join(AUDIO_FOLDER, log.bot_audio_filename))
-
         # Delete database record
-        log.delete_instance()
+        with write_transaction():
+            log.delete_instance()
+            bump_counters(
+                [
+                    {
+                        "timestamp": log.timestamp,
+                        "user_message": log.user_message,
+                        "bot_response": log.bot_response,
+                        "status": log.status,
+                        "intent": log.intent,
+                    }
+                ],
+                sign=-1,
+            )
+
+        # Stored audio is content-addressed, so another log may point at the
+        # same file; cached TTS is shared by design and stays in the cache
+        for filename in {log.user_audio_filename, log.bot_audio_filename}:
+            if filename and not tts_cache.owns(filename) and not audio_in_use(filename):
+                audio_store.delete(filename)
 
         flash("Chat log deleted successfully!", "success")
     except ChatLog.DoesNotExist:
@@ -204,6 +613,140 @@ def delete_chat_log(log_id):
     return redirect(url_for("chat_logs"))
 
 
+@app.route("/admin/chatlogs/<int:log_id>/user-audio")
+@login_required
+def chat_log_user_audio(log_id):
+    """
+    Audio for the user side of a chat log. Voice uploads are served as-is;
+    typed messages are synthesized on first listen and kept in the TTS cache.
+    """
+    log = ChatLog.get_or_none(ChatLog.id == log_id)
+    if log is None:
+        return jsonify({"error": "Chat log not found"}), 404
+    filename = log.user_audio_filename
+    if not audio_store.exists(filename):
+        try:
+            filename = tts_cache.get(log.user_message, lang="en", tld="com", slow=False)
+        except Exception as e:
+            print(f"Error generating user TTS audio: {e}")
+            return jsonify({"error": "Could not generate audio"}), 503
+    return redirect(audio_store.url(filename))
+
+
+@app.route("/admin/tts-cache")
+@login_required
+def tts_cache_stats():
+    """Hit/miss counters and disk usage of the TTS cache."""
+    return jsonify(tts_cache.stats())
+
+
+@app.route("/admin/rasa-client")
+@login_required
+def rasa_client_stats():
+    """Latency and circuit breaker state of the Rasa webhook client."""
+    return jsonify(rasa_client.stats())
+
+
+@app.route("/admin/response-cache", methods=["GET", "POST"])
+@login_required
+def response_cache_admin():
+    """Response cache counters; POST empties the cache."""
+    if request.method == "POST":
+        response_cache.invalidate()
+    return jsonify(response_cache.stats())
+
+
+@app.route("/admin/log-writer")
+@login_required
+def log_writer_stats():
+    """Queue depth, drops and flush latency of the write-behind logger."""
+    return jsonify(log_writer.stats())
+
+
+@app.route("/admin/profiler", methods=["GET", "POST"])
+@login_required
+def profiler_admin():
+    """Sampling profiler state; POST action=start|stop|reset (and interval_ms)."""
+    if request.method == "POST":
+        action = request.values.get("action")
+        if action == "start":
+            interval_ms = request.values.get("interval_ms", type=float)
+            profiler.start(interval_ms / 1000 if interval_ms else None)
+        elif action == "stop":
+            profiler.stop()
+        elif action == "reset":
+            profiler.reset()
+        else:
+            return jsonify({"error": "action must be start, stop or reset"}), 400
+    return jsonify(profiler.stats())
+
+
+@app.route("/admin/profiler/stacks")
+@login_required
+def profiler_stacks():
+    """Sampled stacks in collapsed format, for flamegraph.pl or speedscope."""
+    limit = request.args.get("limit", type=int)
+    return Response(profiler.collapsed(limit), mimetype="text/plain")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != (
+        f"Bearer {METRICS_TOKEN}"
+    ):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/admin/faq-index")
+@login_required
+def faq_index_stats():
+    """Size of the local FAQ index and its top-1 agreement with Rasa."""
+    return jsonify(faq_index.stats())
+
+
+@app.route("/api/analytics/queries")
+@login_required
+def analytics_queries():
+    """Queries per hour or day, from the rollup counters."""
+    bucket = request.args.get("bucket", "day")
+    if bucket not in analytics.MAX_SPAN:
+        return jsonify({"error": "bucket must be 'hour' or 'day'"}), 400
+    span = request.args.get("span", 24 if bucket == "hour" else 30, type=int)
+    return jsonify({"bucket": bucket, "series": analytics.queries_series(bucket, span)})
+
+
+@app.route("/api/analytics/answer-rate")
+@login_required
+def analytics_answer_rate():
+    """Share of queries answered per hour or day."""
+    bucket = request.args.get("bucket", "day")
+    if bucket not in analytics.MAX_SPAN:
+        return jsonify({"error": "bucket must be 'hour' or 'day'"}), 400
+    span = request.args.get("span", 24 if bucket == "hour" else 30, type=int)
+    return jsonify(
+        {"bucket": bucket, "series": analytics.answer_rate_series(bucket, span)}
+    )
+
+
+@app.route("/api/analytics/top-intents")
+@login_required
+def analytics_top_intents():
+    """Most frequent intents, all time or over the last `days` days."""
+    limit = request.args.get("limit", 10, type=int)
+    days = request.args.get("days", type=int)
+    return jsonify({"intents": analytics.top_intents(limit, days)})
+
+
+@app.route("/api/analytics/top-unanswered")
+@login_required
+def analytics_top_unanswered():
+    """Questions the bot most often failed to answer."""
+    limit = request.args.get("limit", 10, type=int)
+    return jsonify({"questions": analytics.top_unanswered(limit)})
+
+
 @app.route("/logout")
 @logout
 def admin_logout():
@@ -223,101 +766,299 @@ def static_files(filename):
     return send_from_directory("static", filename)
 
 
+@app.route("/audio/<path:name>")
+def audio_file(name):
+    """Stored audio, with ETags and range requests (or X-Sendfile offload)."""
+    return audio_store.serve(name)
+
+
 @app.route("/about.html")
 def about():
     """Serves the about page. Ensure about.html exists in static/"""
     return render_template("about.html")
 
 
+def bot_tts(bot_response_text):
+    """Return the (possibly cached) audio filename for a reply, or None."""
+    try:
+        with chat_stage_seconds.time(stage="tts"):
+            return tts_manifest.get(bot_response_text) or tts_cache.get(
+                bot_response_text, lang="en", tld="com", slow=False
+            )
+    except Exception as e:
+        print(f"Error generating bot TTS audio: {e}")
+        return None
+
+
+def add_intent(fields):
+    """
+    Fill in the intent Rasa's NLU gives the message. It is parsed from the
+    message text rather than read from the tracker, which may already have
+    moved on to the user's next message.
+    """
+    with chat_stage_seconds.time(stage="intent"):
+        intent, confidence = rasa_client.parse(fields["user_message"])
+    record_intent(fields, intent, confidence)
+
+
+def record_intent(fields, intent, confidence):
+    """set_intent(), and keep the intent with the cached answer for next time."""
+    set_intent(fields, intent, confidence)
+    if intent and RESPONSE_CACHE_ENABLED:
+        response_cache.set_intent(fields["user_message"], intent, confidence)
+
+
+def set_intent(fields, intent, confidence):
+    fields["intent"] = intent
+    fields["confidence"] = confidence
+    if intent == "nlu_fallback" and fields["status"] == STATUS_ANSWERED:
+        fields["status"] = STATUS_FALLBACK
+
+
+def log_chat(fetch_intent=False, **fields):
+    """Queue one chat interaction for the write-behind logger."""
+    if fetch_intent:
+        add_intent(fields)
+    log_writer.enqueue(fields)
+
+
+def log_voice_chat(log_fields, fetch_intent):
+    """Transcode the user's voice upload, then log the interaction with it."""
+    with chat_stage_seconds.time(stage="transcode"):
+        name, duration, size = compress_voice(
+            audio_store, log_fields["user_audio_filename"]
+        )
+    log_fields.update(
+        user_audio_filename=name, user_audio_duration=duration, user_audio_size=size
+    )
+    log_chat(fetch_intent, **log_fields)
+
+
+def finish_chat(log_fields, need_bot_tts, fetch_intent):
+    """
+    Background half of an async /chat request: synthesize the bot audio if
+    it is still missing, log the interaction, and return the bot audio URL.
+    """
+    if need_bot_tts:
+        log_fields["bot_audio_filename"] = bot_tts(log_fields["bot_response"])
+    if log_fields["user_audio_filename"]:
+        # Don't hold the bot audio back while the voice upload is transcoded
+        background.run(log_voice_chat, log_fields, fetch_intent)
+    else:
+        log_chat(fetch_intent, **log_fields)
+    return audio_store.url(log_fields["bot_audio_filename"])
+
+
+def known_answer(user_message):
+    """
+    (replies, intent, confidence) that need no Rasa call (response cache,
+    FAQ fast path), or None. The intent is None if it isn't known yet.
+    """
+    if RESPONSE_CACHE_ENABLED:
+        cached = response_cache.get(user_message)
+        if cached is not None:
+            return cached
+    if FAQ_FASTPATH_THRESHOLD is not None:
+        with chat_stage_seconds.time(stage="faq_fastpath"):
+            local = faq_answer(user_message, FAQ_FASTPATH_THRESHOLD)
+        if local:
+            text, intent, score = local
+            return [{"text": text}], intent, score
+    return None
+
+
+def faq_answer(user_message, threshold):
+    """(reply, intent, score) from the FAQ index if it scores at least threshold."""
+    name, score = faq_index.match(user_message, threshold)
+    if name is None:
+        return None
+    return faq_index.responses[name][0], faq_index.intent(name), score
+
+
+def remember_answer(user_message, bot_responses, run=None):
+    """
+    Cache what Rasa replied and check it against the local FAQ index, via
+    run(fn, *args) (background.run by default, which may block for a slot).
+    """
+    if RESPONSE_CACHE_ENABLED:
+        response_cache.put(user_message, bot_responses)
+    if bot_responses:
+        (run or background.run)(
+            faq_index.record_agreement, user_message, bot_responses[0].get("text")
+        )
+
+
+def reply_status(bot_response_text):
+    return STATUS_FALLBACK if bot_response_text in FALLBACK_TEXTS else STATUS_ANSWERED
+
+
+def fallback_answer(user_message):
+    """Rasa is down or failed: (reply, intent, score) if we're confident enough."""
+    with chat_stage_seconds.time(stage="faq_fallback"):
+        return faq_answer(user_message, FAQ_FALLBACK_THRESHOLD)
+
+
+def known_bot_audio(bot_response_text):
+    """
+    (filename, source) of audio for a reply that needs no synthesis:
+    pre-rendered or cached audio is free. (None, "synthesized") otherwise.
+    """
+    filename = tts_manifest.get(bot_response_text)
+    if filename:
+        return filename, "manifest"
+    filename = tts_cache.lookup(bot_response_text, lang="en", tld="com", slow=False)
+    if filename:
+        return filename, "cache"
+    return None, "synthesized"
+
+
+def rasa_error_kind(e):
+    if isinstance(e, RasaUnavailable):
+        return "breaker_open"
+    if isinstance(e, requests.exceptions.Timeout):
+        return "timeout"
+    return "connection"
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     """
     Handles incoming chat messages from the frontend.
     Now supports both text and voice audio uploads.
+
+    In async mode (CHAT_ASYNC_AUDIO=1) the text reply is returned as soon as
+    Rasa answers; TTS and logging run in the background and the frontend
+    polls /chat/audio/<job_id> for the bot audio.
     """
     user_id = request.form.get("userId", "anonymous")
     user_message = request.form.get("message", "")
+    timestamp = datetime.utcnow()
 
-    # Handle voice audio file if present
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+
+    # Handle voice audio file if present. It is stored as uploaded and
+    # transcoded to Opus in the background before the chat is logged.
     user_audio_filename = None
-    user_audio_url = None
 
     if "voice_audio" in request.files:
         voice_file = request.files["voice_audio"]
         if voice_file and voice_file.filename != "":
-            user_audio_filename = (
-                f"user_voice_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.wav"
-            )
-            user_audio_path = os.path.join(AUDIO_FOLDER, user_audio_filename)
-            voice_file.save(user_audio_path)
-            user_audio_url = f"/{AUDIO_FOLDER}/{user_audio_filename}"
-
-    # If no voice file but we have text, create TTS as fallback
-    elif user_message:
-        try:
-            user_audio_filename = (
-                f"user_tts_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.mp3"
-            )
-            user_audio_path = os.path.join(AUDIO_FOLDER, user_audio_filename)
-            user_tts = gTTS(text=user_message, lang="en", slow=False, tld="com")
-            user_tts.save(user_audio_path)
-            user_audio_url = f"/{AUDIO_FOLDER}/{user_audio_filename}"
-        except Exception as e:
-            print(f"Error generating user TTS audio: {e}")
+            ext = upload_ext(voice_file.filename)
+            try:
+                with chat_stage_seconds.time(stage="upload"):
+                    user_audio_filename = audio_store.save(
+                        voice_file.stream, ext, max_bytes=VOICE_MAX_BYTES
+                    )
+            except AudioTooLarge:
+                return jsonify({"error": "Voice recording is too large"}), 413
 
-    if not user_message:
-        return jsonify({"error": "No message provided"}), 400
+    # Typed messages get no audio here; admins can render it on demand
+    # from the chat log viewer (see chat_log_user_audio).
 
     bot_response_text = "Sorry, I couldn't get a response from the bot."
     bot_audio_url = None
     bot_audio_filename = None
+    need_bot_tts = False
+    answered = False
+    status = STATUS_ERROR
+    intent = confidence = None
+    rasa_answered = False  # now or earlier, via the response cache
 
     try:
-        # Send message to Rasa chatbot
-        rasa_payload = {"sender": user_id, "message": user_message}
-        rasa_response = requests.post(RASA_SERVER_URL, json=rasa_payload)
-        rasa_response.raise_for_status()
-        bot_responses = rasa_response.json()
+        # Send message to Rasa chatbot, unless the answer is already known
+        known = known_answer(user_message)
+        if known is None:
+            with chat_stage_seconds.time(stage="rasa"):
+                bot_responses = rasa_client.send_message(user_id, user_message)
+            remember_answer(user_message, bot_responses)
+        else:
+            bot_responses, intent, confidence = known
 
         if bot_responses:
             bot_response_text = bot_responses[0].get("text", bot_response_text)
+            answered = rasa_answered = True
+            status = reply_status(bot_response_text)
 
-            # Generate TTS audio for the bot's response
-            try:
-                bot_audio_filename = (
-                    f"bot_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.mp3"
-                )
-                bot_audio_path = os.path.join(AUDIO_FOLDER, bot_audio_filename)
-                bot_tts = gTTS(text=bot_response_text, lang="en", slow=False, tld="com")
-                bot_tts.save(bot_audio_path)
-                bot_audio_url = f"/{AUDIO_FOLDER}/{bot_audio_filename}"
-            except Exception as e:
-                print(f"Error generating bot TTS audio: {e}")
-
-    except requests.exceptions.ConnectionError:
-        bot_response_text = "Sorry, the chatbot service is currently unavailable. Please try again later."
+    except (
+        RasaUnavailable,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    ) as e:
+        bot_response_text = RASA_UNAVAILABLE_MESSAGE
+        status = STATUS_RASA_UNAVAILABLE
+        rasa_errors.inc(kind=rasa_error_kind(e))
     except Exception as e:
         print(f"Error: {e}")
+        rasa_errors.inc(kind="other")
 
-    # Log the chat interaction - FIXED MODEL NAME
-    try:
-        ChatLog.create(
-            user_id=user_id,
-            user_message=user_message,
-            bot_response=bot_response_text,
-            user_audio_filename=user_audio_filename,
-            bot_audio_filename=bot_audio_filename,  # FIXED: No split needed
-            timestamp=datetime.utcnow(),
-        )
-        print("Chat interaction logged to database.")
-    except Exception as e:
-        print(f"Error logging chat interaction to database: {e}")
+    if not answered:
+        local_answer = fallback_answer(user_message)
+        if local_answer:
+            bot_response_text, intent, confidence = local_answer
+            answered = True
+            status = STATUS_ANSWERED_LOCALLY
+
+    if answered:
+        bot_audio_filename, audio_source = known_bot_audio(bot_response_text)
+        if not bot_audio_filename:
+            if CHAT_ASYNC_AUDIO:
+                need_bot_tts = True
+            else:
+                bot_audio_filename = bot_tts(bot_response_text)
+        bot_audio_url = audio_store.url(bot_audio_filename)
+        bot_audio_sources.inc(source=audio_source)
+    chat_outcomes.inc(status=status)
+
+    log_fields = dict(
+        user_id=user_id,
+        user_message=user_message,
+        bot_response=bot_response_text,
+        user_audio_filename=user_audio_filename,
+        bot_audio_filename=bot_audio_filename,
+        timestamp=timestamp,
+        status=status,
+        intent=None,
+        confidence=None,
+        user_audio_duration=None,
+        user_audio_size=None,
+    )
+    set_intent(log_fields, intent, confidence)
+    fetch_intent = rasa_answered and intent is None and RASA_FETCH_INTENT
+    bot_audio_job = None
+
+    if need_bot_tts:
+        bot_audio_job = background.submit(finish_chat, log_fields, True, fetch_intent)
+    elif user_audio_filename:
+        background.run(log_voice_chat, log_fields, fetch_intent)
+    elif fetch_intent and CHAT_ASYNC_AUDIO:
+        background.run(log_chat, fetch_intent, **log_fields)
+    else:
+        # Nothing slow left to do: straight into the bounded log queue
+        log_chat(fetch_intent, **log_fields)
 
     return jsonify(
         {
             "response": bot_response_text,
             "user_audio_url": None,
             "bot_audio_url": bot_audio_url,
+            "bot_audio_job": bot_audio_job,
+        }
+    )
+
+
+@app.route("/chat/audio/<job_id>")
+def chat_audio(job_id):
+    """Poll for bot audio that is being synthesized in the background."""
+    status, bot_audio_url = background.status(job_id)
+    if status == "pending":
+        return jsonify({"status": "pending"}), 202
+    if status == "unknown":
+        return jsonify({"status": "unknown"}), 404
+    return jsonify(
+        {
+            "status": "ready" if bot_audio_url else "failed",
+            "bot_audio_url": bot_audio_url,
         }
     )
 
@@ -327,5 +1068,4 @@ if __name__ == "__main__":
     # Ensure the static/audio directory exists
     if not os.path.exists(AUDIO_FOLDER):
         os.makedirs(AUDIO_FOLDER)
-    app.secret_key = "Lc6AI3fIZpFUrJjWE33"
     app.run(debug=True, port=5000)  # Run on port 5000
@@ -0,0 +1,413 @@
+# asgi.py
+"""
+Async serving mode: /chat runs under asyncio, every other route is the
+Flask app mounted as WSGI.
+
+    uvicorn asgi:app --port 5000
+    python asgi.py --port 5000
+
+A request waiting on Rasa holds a coroutine instead of a worker thread,
+so one process can keep hundreds of conversations in flight. Rasa calls
+are capped by ASGI_RASA_CONCURRENCY; blocking work (upload hashing, TTS,
+transcoding, log writes) runs in a pool of ASGI_BLOCKING_THREADS. After
+the reply, bot TTS, the voice transcode and the intent lookup run
+concurrently before the interaction is logged.
+
+Requires starlette, aiohttp, a2wsgi and python-multipart (and uvicorn to
+serve it). Configuration is otherwise the same as app.py.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import partial, wraps
+
+import aiohttp
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as stubot
+from audio_store import AudioTooLarge, upload_ext
+from model import STATUS_ANSWERED_LOCALLY, STATUS_ERROR, STATUS_RASA_UNAVAILABLE
+from rasa_client import RasaUnavailable
+from transcode import compress_voice
+
+ASGI_RASA_CONCURRENCY = int(os.environ.get("ASGI_RASA_CONCURRENCY", "200"))
+ASGI_BLOCKING_THREADS = int(os.environ.get("ASGI_BLOCKING_THREADS", "16"))
+# Threads serving the mounted Flask routes (admin pages, audio, ...)
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+
+blocking_pool = ThreadPoolExecutor(
+    max_workers=ASGI_BLOCKING_THREADS, thread_name_prefix="asgi-blocking"
+)
+_pending = set()  # finish_chat tasks, kept referenced until they are done
+
+
+async def blocking(fn, *args, **kwargs):
+    """Run fn in the blocking pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_pool, partial(fn, *args, **kwargs))
+
+
+def in_background(fn, *args):
+    """
+    Start fn in the blocking pool without waiting for it. Unlike
+    background.run this never blocks the loop for a free slot.
+    """
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(blocking_pool, partial(fn, *args))
+
+
+class AsyncRasaClient:
+    """
+    asyncio counterpart of rasa_client.RasaClient that shares its circuit
+    breaker and latency stats. At most max_concurrency calls are in flight;
+    the rest wait on a semaphore rather than on a thread. Like the sync
+    client, failed connects and 502/503/504 are retried, timeouts are not.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, client, max_concurrency=ASGI_RASA_CONCURRENCY):
+        self.client = client
+        self.base = client.url.split("/webhooks/")[0]
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        connect_timeout, read_timeout = client.timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self._session = None  # created on first use, inside the event loop
+
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            )
+        return self._session
+
+    async def _request(self, method, url, **kwargs):
+        """(response, JSON body or None), retried like the sync client."""
+        for attempt in range(self.client.retries + 1):
+            if attempt:
+                await asyncio.sleep(0.2 * 2 ** (attempt - 1))
+            last = attempt == self.client.retries
+            try:
+                async with self.session().request(method, url, **kwargs) as response:
+                    if response.status in self.RETRY_STATUSES and not last:
+                        continue
+                    if response.status >= 400:
+                        return response, None
+                    return response, await response.json(content_type=None)
+            except aiohttp.ClientConnectorError:
+                if last:
+                    raise
+
+    async def send_message(self, sender, message):
+        """POST a message to the webhook and return Rasa's list of replies."""
+        self.client.admit()
+        failed = True
+        try:
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    response, replies = await self._request(
+                        "POST",
+                        self.client.url,
+                        json={"sender": sender, "message": message},
+                    )
+                    failed = response.status >= 500
+                finally:
+                    self.client.record(time.perf_counter() - start, failed=failed)
+        finally:
+            # However the call ends (a bad body, a cancelled request), settle
+            # the breaker, or a half-open trial call never finishes
+            self._settle(failed)
+
+        response.raise_for_status()
+        return replies
+
+    def _settle(self, failed):
+        if failed:
+            self.client.breaker.record_failure()
+        else:
+            self.client.breaker.record_success()
+
+    async def parse(self, text):
+        """
+        (intent, confidence) from /model/parse, like RasaClient.parse();
+        (None, None) on error or while the breaker is open.
+        """
+        if not self.client.breaker.is_closed():
+            return None, None
+        try:
+            async with self.semaphore:
+                response, parsed = await self._request(
+                    "POST",
+                    f"{self.base}/model/parse",
+                    json={"text": text},
+                    timeout=aiohttp.ClientTimeout(
+                        total=None,
+                        sock_connect=self.timeout.sock_connect,
+                        sock_read=self.client.parse_timeout,
+                    ),
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None, None
+        if parsed is None:
+            return None, None
+        intent = parsed.get("intent") or {}
+        return intent.get("name"), intent.get("confidence")
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+rasa = AsyncRasaClient(stubot.rasa_client)
+
+
+def rasa_error_kind(e):
+    if isinstance(e, RasaUnavailable):
+        return "breaker_open"
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    return "connection"
+
+
+def observed(endpoint):
+    """Record request count and latency like app.record_request_metrics."""
+
+    def decorator(handler):
+        @wraps(handler)
+        async def timed(request):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            finally:
+                stubot.http_requests.inc(
+                    endpoint=endpoint, method=request.method, status=status
+                )
+                stubot.http_seconds.observe(
+                    time.perf_counter() - start,
+                    endpoint=endpoint,
+                    method=request.method,
+                )
+
+        return timed
+
+    return decorator
+
+
+async def finish_chat(log_fields, need_bot_tts, fetch_intent):
+    """
+    Everything after the reply: synthesize the bot audio if it is still
+    missing, transcode the voice upload and look up the intent, all at
+    once, then log the interaction. Returns the bot audio URL.
+    """
+
+    async def synthesize():
+        if need_bot_tts:
+            log_fields["bot_audio_filename"] = await blocking(
+                stubot.bot_tts, log_fields["bot_response"]
+            )
+
+    async def transcode():
+        if log_fields["user_audio_filename"]:
+            with stubot.chat_stage_seconds.time(stage="transcode"):
+                name, duration, size = await blocking(
+                    compress_voice,
+                    stubot.audio_store,
+                    log_fields["user_audio_filename"],
+                )
+            log_fields.update(
+                user_audio_filename=name,
+                user_audio_duration=duration,
+                user_audio_size=size,
+            )
+
+    async def add_intent():
+        if fetch_intent:
+            with stubot.chat_stage_seconds.time(stage="intent"):
+                intent, confidence = await rasa.parse(log_fields["user_message"])
+            stubot.record_intent(log_fields, intent, confidence)
+
+    # A failed step must not cost the log: record what we have regardless
+    for error in await asyncio.gather(
+        synthesize(), transcode(), add_intent(), return_exceptions=True
+    ):
+        if isinstance(error, Exception):
+            print(f"Error finishing chat: {error}")
+    await blocking(stubot.log_writer.enqueue, log_fields)
+    return stubot.audio_store.url(log_fields["bot_audio_filename"])
+
+
+@observed("chat")
+async def chat(request):
+    """The /chat route of app.py, without tying up a thread while Rasa answers."""
+    length = request.headers.get("content-length")
+    if (
+        length
+        and length.isdigit()
+        and int(length) > stubot.app.config["MAX_CONTENT_LENGTH"]
+    ):
+        return JSONResponse({"error": "Voice recording is too large"}, 413)
+
+    async with request.form() as form:
+        user_id = form.get("userId", "anonymous")
+        user_message = form.get("message", "")
+        timestamp = datetime.utcnow()
+
+        if not user_message:
+            return JSONResponse({"error": "No message provided"}, 400)
+
+        # Stored as uploaded; transcoded in finish_chat before logging
+        user_audio_filename = None
+        voice_file = form.get("voice_audio")
+        if isinstance(voice_file, UploadFile) and voice_file.filename:
+            ext = upload_ext(voice_file.filename)
+            try:
+                with stubot.chat_stage_seconds.time(stage="upload"):
+                    user_audio_filename = await blocking(
+                        stubot.audio_store.save,
+                        voice_file.file,
+                        ext,
+                        max_bytes=stubot.VOICE_MAX_BYTES,
+                    )
+            except AudioTooLarge:
+                return JSONResponse({"error": "Voice recording is too large"}, 413)
+
+    bot_response_text = "Sorry, I couldn't get a response from the bot."
+    bot_audio_url = None
+    bot_audio_filename = None
+    need_bot_tts = False
+    answered = False
+    status = STATUS_ERROR
+    intent = confidence = None
+    rasa_answered = False  # now or earlier, via the response cache
+
+    try:
+        known = stubot.known_answer(user_message)
+        if known is None:
+            with stubot.chat_stage_seconds.time(stage="rasa"):
+                bot_responses = await rasa.send_message(user_id, user_message)
+            stubot.remember_answer(user_message, bot_responses, run=in_background)
+        else:
+            bot_responses, intent, confidence = known
+
+        if bot_responses:
+            bot_response_text = bot_responses[0].get("text", bot_response_text)
+            answered = rasa_answered = True
+            status = stubot.reply_status(bot_response_text)
+
+    except (RasaUnavailable, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        bot_response_text = stubot.RASA_UNAVAILABLE_MESSAGE
+        status = STATUS_RASA_UNAVAILABLE
+        stubot.rasa_errors.inc(kind=rasa_error_kind(e))
+    except Exception as e:
+        print(f"Error: {e}")
+        stubot.rasa_errors.inc(kind="other")
+
+    if not answered:
+        local_answer = stubot.fallback_answer(user_message)
+        if local_answer:
+            bot_response_text, intent, confidence = local_answer
+            answered = True
+            status = STATUS_ANSWERED_LOCALLY
+
+    if answered:
+        bot_audio_filename, audio_source = stubot.known_bot_audio(bot_response_text)
+        if not bot_audio_filename:
+            if stubot.CHAT_ASYNC_AUDIO:
+                need_bot_tts = True
+            else:
+                bot_audio_filename = await blocking(stubot.bot_tts, bot_response_text)
+        bot_audio_url = stubot.audio_store.url(bot_audio_filename)
+        stubot.bot_audio_sources.inc(source=audio_source)
+    stubot.chat_outcomes.inc(status=status)
+
+    log_fields = dict(
+        user_id=user_id,
+        user_message=user_message,
+        bot_response=bot_response_text,
+        user_audio_filename=user_audio_filename,
+        bot_audio_filename=bot_audio_filename,
+        timestamp=timestamp,
+        status=status,
+        intent=None,
+        confidence=None,
+        user_audio_duration=None,
+        user_audio_size=None,
+    )
+    stubot.set_intent(log_fields, intent, confidence)
+    fetch_intent = rasa_answered and intent is None and stubot.RASA_FETCH_INTENT
+    task = asyncio.create_task(finish_chat(log_fields, need_bot_tts, fetch_intent))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    bot_audio_job = stubot.background.track(task) if need_bot_tts else None
+
+    return JSONResponse(
+        {
+            "response": bot_response_text,
+            "user_audio_url": None,
+            "bot_audio_url": bot_audio_url,
+            "bot_audio_job": bot_audio_job,
+        }
+    )
+
+
+@observed("chat_audio")
+async def chat_audio(request):
+    """Poll for bot audio that is being synthesized by finish_chat."""
+    status, bot_audio_url = stubot.background.status(request.path_params["job_id"])
+    if status == "pending":
+        return JSONResponse({"status": "pending"}, 202)
+    if status == "unknown":
+        return JSONResponse({"status": "unknown"}, 404)
+    return JSONResponse(
+        {
+            "status": "ready" if bot_audio_url else "failed",
+            "bot_audio_url": bot_audio_url,
+        }
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Let in-flight TTS and logging finish before the process exits
+    if _pending:
+        await asyncio.wait(_pending, timeout=30)
+    await rasa.aclose()
+    blocking_pool.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/audio/{job_id}", chat_audio),
+        Mount("/", app=WSGIMiddleware(stubot.app, workers=ASGI_WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the chatbot with uvicorn")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
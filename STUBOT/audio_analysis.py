@@ -0,0 +1,247 @@
+# audio_analysis.py
+"""
+Voice-quality statistics over the recorded audio.
+
+    python audio_analysis.py summary --folder static/audio --out audio_summary.csv
+    python audio_analysis.py plot static/audio/ab/cd/<hash>.wav --ms 20
+
+`summary` computes duration, RMS, peak, clipping and silence ratio for
+every file, across a process pool. WAV files are memory-mapped and read
+in blocks, so no file is ever loaded into RAM whole. Other formats (the
+Opus transcodes, browser WebM) are streamed through ffmpeg if available.
+Cached TTS files are bot speech and are skipped unless --include-tts.
+"""
+
+import argparse
+import csv
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.io import wavfile
+
+from tts_cache import CACHE_PREFIX
+from transcode import FFMPEG, ffmpeg_available
+
+FRAME_SECONDS = 0.02  # silence is judged per 20 ms frame
+SILENCE_DBFS = -40.0
+CLIP_LEVEL = 0.999  # of full scale
+BLOCK_FRAMES = 500  # frames per block read from the file
+DECODE_RATE = 16000  # sample rate ffmpeg decodes other formats to
+
+FIELDS = (
+    "file",
+    "format",
+    "sample_rate",
+    "channels",
+    "duration_s",
+    "rms_dbfs",
+    "peak_dbfs",
+    "clipping_ratio",
+    "silence_ratio",
+    "error",
+)
+
+
+def dbfs(value):
+    return round(20 * np.log10(value), 2) if value > 0 else None
+
+
+def to_float(block):
+    """Scale integer PCM samples to [-1, 1)."""
+    if block.dtype == np.uint8:
+        return (block.astype(np.float32) - 128) / 128
+    if np.issubdtype(block.dtype, np.integer):
+        return block.astype(np.float32) / np.iinfo(block.dtype).max
+    return block.astype(np.float32, copy=False)
+
+
+class SignalStats:
+    """Running statistics over a mono signal fed in blocks."""
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.frame = max(1, int(sample_rate * FRAME_SECONDS))
+        self.silence_power = 10 ** (SILENCE_DBFS / 10)
+        self.samples = 0
+        self.sum_squares = 0.0
+        self.peak = 0.0
+        self.clipped = 0
+        self.frames = 0
+        self.silent_frames = 0
+        self._tail = np.empty(0, dtype=np.float32)
+
+    def add(self, x):
+        self.samples += len(x)
+        self.sum_squares += float(np.dot(x, x))
+        if len(x):
+            self.peak = max(self.peak, float(np.abs(x).max()))
+            self.clipped += int(np.count_nonzero(np.abs(x) >= CLIP_LEVEL))
+        # Whole frames only; the remainder waits for the next block
+        x = np.concatenate((self._tail, x)) if len(self._tail) else x
+        whole = len(x) - len(x) % self.frame
+        frames = x[:whole].reshape(-1, self.frame)
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame
+        self.frames += len(power)
+        self.silent_frames += int(np.count_nonzero(power < self.silence_power))
+        self._tail = x[whole:].copy()
+
+    def result(self):
+        n = self.samples
+        return {
+            "sample_rate": self.sample_rate,
+            "duration_s": round(n / self.sample_rate, 3),
+            "rms_dbfs": dbfs(np.sqrt(self.sum_squares / n)) if n else None,
+            "peak_dbfs": dbfs(self.peak),
+            "clipping_ratio": round(self.clipped / n, 6) if n else 0.0,
+            "silence_ratio": (
+                round(self.silent_frames / self.frames, 4) if self.frames else 1.0
+            ),
+        }
+
+
+def analyze_wav(path):
+    sample_rate, data = wavfile.read(path, mmap=True)
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    stats = SignalStats(sample_rate)
+    block = stats.frame * BLOCK_FRAMES
+    for start in range(0, len(data), block):
+        chunk = data[start : start + block]
+        # Like the old plotting scripts, look at the first channel only
+        stats.add(to_float(chunk if channels == 1 else chunk[:, 0]))
+    return dict(stats.result(), format="wav", channels=channels)
+
+
+def analyze_decoded(path):
+    """Stream any format through ffmpeg as 16 kHz mono PCM."""
+    stats = SignalStats(DECODE_RATE)
+    proc = subprocess.Popen(
+        [FFMPEG, "-nostdin", "-v", "error", "-i", path]
+        + ["-ac", "1", "-ar", str(DECODE_RATE), "-f", "s16le", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    block = stats.frame * BLOCK_FRAMES * 2  # bytes of int16
+    carry = b""
+    while True:
+        chunk = proc.stdout.read(block)
+        if not chunk:
+            break
+        chunk = carry + chunk
+        carry = chunk[len(chunk) - len(chunk) % 2 :]
+        stats.add(to_float(np.frombuffer(chunk[: len(chunk) - len(carry)], "<i2")))
+    stderr = proc.stderr.read().decode(errors="replace")
+    if proc.wait() != 0:
+        raise RuntimeError(stderr.strip() or f"ffmpeg exited with {proc.returncode}")
+    if not stats.samples:
+        raise RuntimeError("no audio decoded")
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    return dict(stats.result(), format=ext, channels=1)
+
+
+def is_wav(path):
+    with open(path, "rb") as f:
+        header = f.read(12)
+    return header[:4] in (b"RIFF", b"RIFX") and header[8:12] == b"WAVE"
+
+
+def analyze(path, decode=True):
+    """Stats row for one file; failures are reported in the "error" column."""
+    row = {"file": path}
+    try:
+        if is_wav(path):
+            row.update(analyze_wav(path))
+        elif decode:
+            row.update(analyze_decoded(path))
+        else:
+            row["error"] = "not a WAV file and ffmpeg is not available"
+    except Exception as e:
+        row["error"] = str(e).splitlines()[0] if str(e) else type(e).__name__
+    return row
+
+
+def audio_files(folder, include_tts=False):
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.endswith((".json", ".tmp")):  # TTS manifest, partial writes
+                continue
+            if not include_tts and name.startswith(CACHE_PREFIX):
+                continue
+            yield os.path.join(root, name)
+
+
+def analyze_folder(folder, workers=None, include_tts=False):
+    """Yield a stats row per file, computed in a process pool."""
+    paths = list(audio_files(folder, include_tts))
+    decode = ffmpeg_available()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(analyze, paths, [decode] * len(paths), chunksize=16)
+
+
+def write_summary(rows, out):
+    """Write rows as CSV to out and return aggregate figures."""
+    totals = {"files": 0, "errors": 0, "seconds": 0.0, "clipped": 0, "mostly_silent": 0}
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            totals["files"] += 1
+            if row.get("error"):
+                totals["errors"] += 1
+                continue
+            totals["seconds"] += row["duration_s"]
+            totals["clipped"] += row["clipping_ratio"] > 0.001
+            totals["mostly_silent"] += row["silence_ratio"] > 0.8
+    return totals
+
+
+def plot(path, ms=20):
+    """Waveform and digital samples of the first `ms` milliseconds."""
+    import matplotlib.pyplot as plt
+
+    sample_rate, data = wavfile.read(path, mmap=True)
+    if data.ndim > 1:
+        data = data[:, 0]
+    segment = to_float(data[: int(sample_rate * ms / 1000)])
+    t = np.arange(len(segment)) * 1000 / sample_rate
+
+    plt.figure(figsize=(10, 5))
+    plt.plot(t, segment, color="blue", label="Speech waveform x(t)")
+    plt.stem(t, segment, markerfmt="ro", basefmt=" ", label="Digital samples x[n]")
+    plt.xlabel("Time (ms)")
+    plt.ylabel("Amplitude")
+    plt.title("Analog Speech Signal vs Digital Samples")
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="Stats for every audio file")
+    summary.add_argument("--folder", default="static/audio")
+    summary.add_argument("--out", default="audio_summary.csv")
+    summary.add_argument("--workers", type=int, default=None)
+    summary.add_argument("--include-tts", action="store_true")
+    plotter = commands.add_parser("plot", help="Plot the start of one WAV file")
+    plotter.add_argument("file")
+    plotter.add_argument("--ms", type=float, default=20)
+    args = parser.parse_args()
+
+    if args.command == "plot":
+        plot(args.file, args.ms)
+        sys.exit()
+    if not ffmpeg_available():
+        print("ffmpeg not found: only WAV files will be analyzed.")
+    totals = write_summary(
+        analyze_folder(args.folder, args.workers, args.include_tts), args.out
+    )
+    print(
+        f"Analyzed {totals['files']} file(s), {totals['seconds'] / 60:.1f} min of audio "
+        f"({totals['errors']} unreadable): {totals['clipped']} clipped, "
+        f"{totals['mostly_silent']} mostly silent. Details in {args.out}."
+    )
@@ -0,0 +1,286 @@
+# audio_store.py
+"""
+Content-addressed audio storage.
+
+Files live under two levels of hash-prefix directories, e.g.
+static/audio/3f/a9/3fa9...e1.wav, named after the sha256 of their bytes,
+so identical uploads are stored once and no directory grows large.
+Names (the path relative to the audio folder) are what ChatLog stores.
+
+Move files written by older versions into the sharded layout with:
+
+    python audio_store.py migrate
+"""
+
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import Response, abort, send_file
+from werkzeug.security import safe_join
+
+CHUNK_SIZE = 64 * 1024
+# Content-addressed files never change, so browsers may cache them for good
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_MAX_AGE = 24 * 3600
+_DIGEST_NAME = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.\w+$")
+# The only extensions an upload may be stored under, and what they are served as
+AUDIO_TYPES = {
+    ".webm": "audio/webm",
+    ".ogg": "audio/ogg",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+}
+DEFAULT_UPLOAD_EXT = ".webm"  # what browsers' MediaRecorder produces
+
+
+class AudioTooLarge(ValueError):
+    """An upload went over the size limit passed to AudioStore.save()."""
+
+
+def shard(digest, filename):
+    """Sharded name for a file whose name starts with (or is) digest."""
+    return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+def is_sharded(name):
+    return bool(name) and "/" in name
+
+
+def upload_ext(filename):
+    """
+    Extension to store an upload under. The client's filename is not
+    trusted: anything but a known audio type is stored as .webm, so /audio
+    never serves e.g. HTML from an upload.
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if ext in AUDIO_TYPES else DEFAULT_UPLOAD_EXT
+
+
+def audio_mimetype(name):
+    """Always an audio/* type, whatever the stored file is called."""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in AUDIO_TYPES:
+        return AUDIO_TYPES[ext]
+    guessed = mimetypes.guess_type(name)[0]
+    if guessed and guessed.startswith("audio/"):
+        return guessed
+    return AUDIO_TYPES[DEFAULT_UPLOAD_EXT]
+
+
+class AudioStore:
+    """
+    Stores audio under sharded content-hash names and serves it with
+    strong ETags and range support (send_file), or hands the transfer to
+    the front-end server with X-Sendfile (USE_X_SENDFILE) or, when
+    accel_prefix is set, nginx's X-Accel-Redirect.
+    """
+
+    def __init__(self, folder, url_prefix="/audio", accel_prefix=None):
+        self.folder = folder
+        self.url_prefix = url_prefix.rstrip("/")
+        self.accel_prefix = accel_prefix
+        self.deduped = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, name):
+        """Absolute path for a stored name, or None if it escapes the folder."""
+        return safe_join(self.folder, name) if name else None
+
+    def url(self, name):
+        return f"{self.url_prefix}/{name}" if name else None
+
+    def exists(self, name):
+        path = self.path(name)
+        return bool(path) and os.path.isfile(path)
+
+    def save(self, stream, ext, max_bytes=None):
+        """
+        Copy a file-like object into the store in chunks, hashing it on the
+        way. Returns the stored name; content already present is not stored
+        twice. Raises AudioTooLarge once more than max_bytes have been read.
+        """
+        digest = hashlib.sha256()
+        # Unique across threads and forked workers alike
+        fd, tmp = tempfile.mkstemp(prefix="upload.", suffix=".tmp", dir=self.folder)
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise AudioTooLarge(f"Upload is larger than {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._commit(tmp, digest.hexdigest(), ext)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def save_file(self, src, ext=None):
+        """Move an existing file into the store; returns the stored name."""
+        digest = hashlib.sha256()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._commit(src, digest.hexdigest(), ext or os.path.splitext(src)[1])
+
+    def _commit(self, src, digest, ext):
+        name = shard(digest, digest + ext.lower())
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            if os.path.exists(path):
+                self.deduped += 1
+                os.remove(src)
+            else:
+                os.replace(src, path)
+        return name
+
+    def delete(self, name):
+        path = self.path(name)
+        if path and os.path.isfile(path):
+            os.remove(path)
+            return True
+        return False
+
+    def iter_names(self):
+        """Every stored name, flat legacy files included."""
+        for root, _, files in os.walk(self.folder):
+            rel = os.path.relpath(root, self.folder)
+            for filename in files:
+                if rel == ".":
+                    yield filename
+                else:
+                    yield f"{rel.replace(os.sep, '/')}/{filename}"
+
+    def serve(self, name):
+        """Response for GET /audio/<name>, honouring If-None-Match and Range."""
+        path = self.path(name)
+        if not path or not os.path.isfile(path):
+            abort(404)
+        match = _DIGEST_NAME.match(name)
+        if self.accel_prefix:
+            # nginx serves the bytes (and handles ranges) from an internal location
+            response = Response(mimetype=audio_mimetype(name))
+            response.headers["X-Accel-Redirect"] = (
+                self.accel_prefix.rstrip("/") + "/" + name
+            )
+        else:
+            response = send_file(
+                path,
+                mimetype=audio_mimetype(name),
+                conditional=True,
+                # The content hash is a strong ETag; other files get werkzeug's
+                etag=match.group(1) if match else True,
+                max_age=IMMUTABLE_MAX_AGE if match else DEFAULT_MAX_AGE,
+            )
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        if match:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+
+def migrate_flat_files(store, tts_cache, manifest_folder=None, batch_size=500):
+    """
+    Move flat files from older versions into the sharded layout, rewriting
+    ChatLog references and the TTS manifest. Returns the number moved.
+    """
+    from model import ChatLog, write_transaction
+    from presynth import MANIFEST_NAME, manifest_path
+    from tts_cache import CACHE_PREFIX
+
+    renamed = {}
+    for entry in list(os.scandir(store.folder)):
+        if (
+            not entry.is_file()
+            or entry.name == MANIFEST_NAME
+            or entry.name.endswith(".tmp")
+        ):
+            continue
+        if tts_cache.owns(entry.name):
+            # Cached speech keeps its name; it just moves into its shard
+            key = os.path.splitext(entry.name)[0][len(CACHE_PREFIX) :]
+            name = shard(key, entry.name)
+            dest = store.path(name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(entry.path, dest)
+        else:
+            name = store.save_file(entry.path)
+        renamed[entry.name] = name
+
+    if not renamed:
+        return 0
+
+    # Walk the logs once in id order rather than one UPDATE per file
+    last_id = 0
+    while True:
+        rows = list(
+            ChatLog.select(
+                ChatLog.id, ChatLog.user_audio_filename, ChatLog.bot_audio_filename
+            )
+            .where(
+                ChatLog.id > last_id,
+                ChatLog.user_audio_filename.is_null(False)
+                | ChatLog.bot_audio_filename.is_null(False),
+            )
+            .order_by(ChatLog.id)
+            .limit(batch_size)
+        )
+        if not rows:
+            break
+        with write_transaction():
+            for row in rows:
+                user_audio = renamed.get(
+                    row.user_audio_filename, row.user_audio_filename
+                )
+                bot_audio = renamed.get(row.bot_audio_filename, row.bot_audio_filename)
+                if (user_audio, bot_audio) != (
+                    row.user_audio_filename,
+                    row.bot_audio_filename,
+                ):
+                    ChatLog.update(
+                        user_audio_filename=user_audio, bot_audio_filename=bot_audio
+                    ).where(ChatLog.id == row.id).execute()
+        last_id = rows[-1].id
+
+    folder = manifest_folder or store.folder
+    if os.path.exists(manifest_path(folder)):
+        with open(manifest_path(folder), encoding="utf-8") as f:
+            manifest = json.load(f)
+        for entry in manifest.get("entries", {}).values():
+            entry["file"] = renamed.get(entry["file"], entry["file"])
+        tmp = manifest_path(folder) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, manifest_path(folder))
+    return len(renamed)
+
+
+if __name__ == "__main__":
+    from model import db
+    from tts_cache import TTSCache
+
+    parser = argparse.ArgumentParser(description="Audio storage maintenance")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--audio-folder", default="static/audio")
+    args = parser.parse_args()
+
+    db.connect(reuse_if_open=True)
+    store = AudioStore(args.audio_folder)
+    moved = migrate_flat_files(
+        store, TTSCache(args.audio_folder, max_bytes=float("inf"))
+    )
+    print(
+        f"Moved {moved} file(s) into the sharded layout ({store.deduped} duplicate(s) merged)."
+    )
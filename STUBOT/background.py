@@ -0,0 +1,124 @@
+# background.py
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from log_writer import POLICIES, POLICY_BLOCK, POLICY_SYNC
+
+
+class BackgroundJobs:
+    """
+    Runs work off the request thread and remembers the result of the most
+    recent jobs so the frontend can poll for them by id.
+
+    At most max_pending jobs wait or run at once. When that many are
+    pending, `policy` (log_writer's POLICIES) decides what happens to the
+    next one: "sync" runs it on the caller's thread, "block" waits up to
+    block_timeout for a slot and then drops it, "drop" drops it at once.
+    """
+
+    def __init__(
+        self,
+        max_workers=4,
+        max_jobs=1000,
+        max_pending=1000,
+        policy=POLICY_SYNC,
+        block_timeout=0.5,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown background queue policy {policy!r}")
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="chat-bg"
+        )
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = OrderedDict()  # job_id -> Future, oldest first
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.ran_inline = 0
+        self.dropped = 0
+
+    def _start(self, fn, args, kwargs):
+        if self.policy == POLICY_BLOCK:
+            admitted = self._slots.acquire(timeout=self.block_timeout)
+        else:
+            admitted = self._slots.acquire(blocking=False)
+        if admitted:
+            with self._lock:
+                self.pending += 1
+            try:
+                future = self.executor.submit(fn, *args, **kwargs)
+            except BaseException:
+                self._release(None)
+                raise
+            future.add_done_callback(self._release)
+            return future
+
+        future = Future()
+        if self.policy == POLICY_SYNC:
+            with self._lock:
+                self.ran_inline += 1
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            with self._lock:
+                self.dropped += 1
+            future.cancel()
+            future.set_running_or_notify_cancel()
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn and return a job id that can be passed to status()."""
+        return self.track(self._start(fn, args, kwargs))
+
+    def track(self, future):
+        """
+        Remember a future started elsewhere (e.g. an asyncio task) and
+        return a job id for status().
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = future
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job_id
+
+    def run(self, fn, *args, **kwargs):
+        """Fire-and-forget work whose result nobody polls for."""
+        return self._start(fn, args, kwargs)
+
+    def status(self, job_id):
+        """Return ("pending" | "done" | "failed" | "unknown", result)."""
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            return "unknown", None
+        if not future.done():
+            return "pending", None
+        if future.cancelled() or future.exception() is not None:
+            return "failed", None
+        return "done", future.result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "policy": self.policy,
+                "ran_inline": self.ran_inline,
+                "dropped": self.dropped,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,391 @@
+# bench/bench_chat.py
+"""
+Load test for the web app with Rasa and TTS replaced by local stubs.
+
+Starts the app on a local server (werkzeug's threaded server, or uvicorn
+with asgi.py for --server asgi) with a fresh database and audio folder,
+points it at a StubRasa (see stubs.py) and swaps the TTS backend's
+synthesizer for one of fixed cost. Client threads then replay a weighted mix of
+typed questions, voice uploads (both built from the domain.yml intents),
+dashboard loads and chat log pages, and throughput and p50/p95/p99
+latency are reported per request kind.
+
+    python bench/bench_chat.py --clients 8 --seconds 20
+    python bench/bench_chat.py --server asgi --clients 200 --rasa-latency-ms 500
+    python bench/bench_chat.py --save-baseline bench/baseline_chat.json
+    python bench/bench_chat.py --compare bench/baseline_chat.json
+
+--compare exits with status 1 if any request kind's p95 got slower, or
+its throughput lower, than the baseline by more than --tolerance.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+
+from stubs import StubRasa, stub_tts
+
+DEFAULT_MIX = "text=70,voice=10,dashboard=10,chatlogs=10"
+TEMPLATES = [
+    "{}",
+    "tell me about {}",
+    "what about the {} at STU",
+    "I need information on {} please",
+    "{}?",
+]
+# Questions no intent matches, so Rasa falls back
+OFF_TOPIC = [
+    "what is the weather like today",
+    "can you recommend a good movie",
+    "asdf qwerty",
+]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, weight = part.split("=")
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {"text", "voice", "dashboard", "chatlogs"}
+    if unknown:
+        raise ValueError(f"unknown request kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def make_questions(intents, off_topic_share=0.1, seed=0):
+    rng = random.Random(seed)
+    questions = [
+        template.format(intent.replace("_", " "))
+        for intent in intents
+        for template in TEMPLATES
+    ]
+    extra = int(len(questions) * off_topic_share)
+    questions += [rng.choice(OFF_TOPIC) for _ in range(extra)]
+    return questions
+
+
+def make_voice(seconds=3.0, rate=16000, seed=0):
+    """A quiet noise recording, as PCM WAV bytes."""
+    samples = np.random.default_rng(seed).normal(0, 2000, int(seconds * rate))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.clip(-32768, 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def start_app(workdir, rasa_url, tts_cost_ms, seed_rows, mode="wsgi"):
+    """
+    Import the app inside workdir and serve it on a free local port, with
+    werkzeug's threaded server ("wsgi") or uvicorn and asgi.py ("asgi").
+    Returns (app module, function that stops the server, base URL).
+    """
+    shutil.copy(os.path.join(APP_DIR, "domain.yml"), workdir)
+    os.chdir(workdir)  # database, audio folder and domain.yml are relative
+    os.environ["RASA_SERVER_URL"] = rasa_url
+    os.environ.setdefault("RASA_MODEL_CHECK_SECONDS", "3600")
+
+    import app as stubot
+    from model import record_chats
+
+    stubot.app.secret_key = "bench"
+    stubot.tts_cache.synthesize = stub_tts(tts_cost_ms)
+
+    # Something for the dashboard and chat log pages to read
+    now = datetime.utcnow()
+    record_chats(
+        [
+            {
+                "user_id": f"user_{i % 97}",
+                "user_message": f"where is the library {i}",
+                "bot_response": "The library is open from 8am to 10pm.",
+                "timestamp": now - timedelta(seconds=seed_rows - i),
+                "status": "answered" if i % 5 else "fallback",
+                "intent": "library",
+                "confidence": 0.9,
+            }
+            for i in range(seed_rows)
+        ]
+    )
+    stubot.db.close()
+
+    if mode == "asgi":
+        return (stubot,) + serve_asgi()
+    return (stubot,) + serve_wsgi(stubot.app)
+
+
+def serve_wsgi(wsgi_app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(
+        "127.0.0.1", 0, wsgi_app, threaded=True, request_handler=QuietHandler
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown, f"http://127.0.0.1:{server.server_port}"
+
+
+def serve_asgi():
+    import uvicorn
+
+    import asgi
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(asgi.app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]})
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True  # runs the lifespan shutdown
+        thread.join()
+
+    return stop, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def login(base):
+    """
+    Session cookies of the default admin. Clients share one login: password
+    hashing is deliberately slow and would otherwise swamp the warmup.
+    """
+    session = requests.Session()
+    session.post(
+        f"{base}/admin-login", data={"username": "admin", "password": "admin123"}
+    )
+    return session.cookies
+
+
+def client(base, cookies, mix, questions, voice, stop, measuring, results, lock, seed):
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    session = requests.Session()
+    session.cookies.update(cookies)
+    user_id = f"bench_{seed}"
+    while not stop.is_set():
+        kind = rng.choices(kinds, weights)[0]
+        question = rng.choice(questions)
+        start = time.perf_counter()
+        try:
+            if kind == "text":
+                r = session.post(
+                    f"{base}/chat", data={"userId": user_id, "message": question}
+                )
+            elif kind == "voice":
+                r = session.post(
+                    f"{base}/chat",
+                    data={"userId": user_id, "message": question},
+                    files={"voice_audio": ("user_voice.wav", voice, "audio/wav")},
+                )
+            elif kind == "dashboard":
+                r = session.get(f"{base}/dashboard")
+            else:
+                r = session.get(f"{base}/admin/chatlogs")
+            ok = r.status_code < 400 and not r.url.endswith("/admin-login")
+        except requests.exceptions.RequestException:
+            ok = False
+        seconds = time.perf_counter() - start
+        if measuring.is_set():
+            with lock:
+                results.setdefault(kind, []).append((seconds, ok))
+
+
+def drive(base, cookies, mix, questions, voice, clients, warmup, seconds, seed):
+    """Run the client threads and return {kind: [(seconds, ok), ...]}."""
+    stop, measuring = threading.Event(), threading.Event()
+    results, lock = {}, threading.Lock()
+    threads = [
+        threading.Thread(
+            target=client,
+            args=(base, cookies, mix, questions, voice, stop, measuring, results, lock)
+            + (seed + n,),
+        )
+        for n in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(warmup)
+    measuring.set()
+    time.sleep(seconds)
+    measuring.clear()
+    stop.set()
+    for t in threads:
+        t.join()
+    return results
+
+
+def pct(values, p):
+    """Nearest-rank percentile of sorted values."""
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def summarize(results, seconds):
+    summary = {}
+    for kind, samples in sorted(results.items()):
+        latencies = sorted(s for s, _ in samples)
+        summary[kind] = {
+            "requests": len(samples),
+            "errors": sum(not ok for _, ok in samples),
+            "rps": round(len(samples) / seconds, 2),
+            "p50_ms": round(pct(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(pct(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(pct(latencies, 0.99) * 1000, 1),
+        }
+    total = sum(len(samples) for samples in results.values())
+    summary["all"] = {"requests": total, "rps": round(total / seconds, 2)}
+    return summary
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix="stubot-bench-")
+    cwd = os.getcwd()
+    stub = StubRasa(
+        latency_ms=args.rasa_latency_ms,
+        jitter_ms=args.rasa_jitter_ms,
+        reply_chars=args.reply_chars,
+        unique_replies=args.unique_replies,
+        domain_path=os.path.join(APP_DIR, "domain.yml"),
+        seed=args.seed,
+    ).start()
+    stubot, stop_server, base = start_app(
+        workdir, stub.url, args.tts_cost_ms, args.seed_rows, args.server
+    )
+    questions = make_questions(stub.intents, seed=args.seed)
+    voice = make_voice(seed=args.seed)
+    cookies = requests.utils.dict_from_cookiejar(login(base))
+
+    # The clients get a process of their own so they don't compete with
+    # the server for this one's GIL
+    spawn = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            results = pool.submit(
+                drive,
+                base,
+                cookies,
+                mix,
+                questions,
+                voice,
+                args.clients,
+                args.warmup,
+                args.seconds,
+                args.seed,
+            ).result()
+    finally:
+        stop_server()
+        # Let voice transcodes, TTS and log writes finish before leaving
+        # workdir, or they would land in the database next to app.py
+        stubot.background.shutdown()
+        stubot.log_writer.close()
+        stub.stop()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(results, args.seconds)
+
+
+def run_config(args):
+    """The options that shape a run, as stored with a baseline."""
+    skip = ("save_baseline", "compare", "tolerance")
+    return {k: v for k, v in vars(args).items() if k not in skip}
+
+
+def compare(summary, baseline, tolerance):
+    """Print the change against baseline; return the regressed kinds."""
+    regressions = []
+    print(f"\n{'vs baseline':<12}{'rps':>10}{'p95':>10}")
+    for kind, base in baseline["results"].items():
+        now = summary.get(kind)
+        if not now or kind == "all":
+            continue
+        rps = now["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        p95 = now["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        flag = ""
+        if rps < -tolerance or p95 > tolerance:
+            regressions.append(kind)
+            flag = "  REGRESSION"
+        print(f"{kind:<12}{rps:>+10.0%}{p95:>+10.0%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /chat and admin pages")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="kind=weight,...")
+    parser.add_argument("--rasa-latency-ms", type=float, default=50)
+    parser.add_argument("--rasa-jitter-ms", type=float, default=30)
+    parser.add_argument("--reply-chars", type=int, default=0)
+    parser.add_argument("--unique-replies", type=float, default=0.05)
+    parser.add_argument("--tts-cost-ms", type=float, default=300)
+    parser.add_argument("--seed-rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    summary = run(args)
+    print(
+        f"{'kind':<12}{'requests':>10}{'errors':>8}{'rps':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for kind, r in summary.items():
+        if kind != "all":
+            print(
+                f"{kind:<12}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10.1f}"
+                f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+            )
+    print(
+        f"{'all':<12}{summary['all']['requests']:>10}{'':>8}{summary['all']['rps']:>10.1f}"
+    )
+
+    if args.save_baseline:
+        machine = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        }
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": run_config(args), "machine": machine, "results": summary},
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"] != run_config(args):
+            print("Note: options differ from the baseline run.")
+        if compare(summary, baseline, args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,115 @@
+# bench/bench_fts.py
+"""
+Chat log search: FTS5 (search.search_logs) against LIKE '%term%' scans.
+
+Loads a fresh temporary database with synthetic chat logs (the FTS
+triggers index them as they are inserted), then times the first page of
+results for a few kinds of query with each method.
+
+    python bench/bench_fts.py --rows 1000000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import db, ChatLog, SQLITE_PRAGMAS, initialize_db
+from search import search_logs
+
+TOPICS = [
+    ("where do I pay school fees", "Fees are paid at the accounts office."),
+    ("what time does the library open", "The library opens from 9am to 8pm."),
+    ("how do I apply for admission", "Apply online through the admissions portal."),
+    ("where is the computer science department", "It is in block C, second floor."),
+    ("when are exams starting", "Exams start in the last week of the semester."),
+    (
+        "is there hostel accommodation",
+        "Hostel forms are at the student affairs office.",
+    ),
+]
+WORDS = "please hello thanks urgent today tomorrow campus student level course".split()
+
+# (label, search box text, LIKE pattern)
+QUERIES = [
+    ("common term", "library", "%library%"),
+    ("phrase", '"school fees"', "%school fees%"),
+    ("two terms", "hostel accommodation", "%hostel accommodation%"),
+    ("rare term", "zebracrossing", "%zebracrossing%"),
+]
+
+
+def make_logs(start, count, rng):
+    ts = datetime(2024, 1, 1) + timedelta(seconds=start * 7)
+    for i in range(start, start + count):
+        question, answer = rng.choice(TOPICS)
+        extra = " ".join(rng.sample(WORDS, 2))
+        if i % 100000 == 0:
+            extra += " zebracrossing"
+        yield {
+            "user_id": f"user_{i % 997}",
+            "user_message": f"{question} {extra} {i}",
+            "bot_response": answer,
+            "timestamp": ts + timedelta(seconds=i * 7),
+            "status": "answered",
+        }
+
+
+def load(rows, batch_size=10000):
+    rng = random.Random(42)
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        with db.atomic():
+            ChatLog.insert_many(
+                list(make_logs(offset, min(batch_size, rows - offset), rng))
+            ).execute()
+    return time.perf_counter() - start
+
+
+def like_page(pattern, limit=10):
+    return list(
+        ChatLog.select()
+        .where(ChatLog.user_message**pattern | ChatLog.bot_response**pattern)
+        .order_by(ChatLog.timestamp.desc(), ChatLog.id.desc())
+        .limit(limit)
+    )
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat log search benchmark")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="stubot-bench-"), "bench.db")
+    db.init(path, pragmas=SQLITE_PRAGMAS)
+    initialize_db()
+    db.connect()
+
+    seconds = load(args.rows)
+    print(
+        f"Inserted {args.rows} rows (indexed by trigger) in {seconds:.1f}s "
+        f"({args.rows / seconds:.0f} rows/s), database {os.path.getsize(path) / 1e6:.0f} MB"
+    )
+
+    print(f"{'query':<14}{'fts5 ms':>10}{'like ms':>10}{'hits':>6}")
+    for label, text, pattern in QUERIES:
+        fts_ms, (logs, _) = timed(lambda: search_logs(text, 10), args.repeat)
+        like_ms, _ = timed(lambda: like_page(pattern), args.repeat)
+        print(f"{label:<14}{fts_ms:>10.1f}{like_ms:>10.1f}{len(logs):>6}")
+    db.close()
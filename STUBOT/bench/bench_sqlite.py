@@ -0,0 +1,114 @@
+# bench/bench_sqlite.py
+"""
+Compare the bare SQLite setup with the tuned profile in model.py.
+
+Writer threads log chat interactions one transaction at a time (like the
+synchronous /chat path did) while reader threads run the dashboard and
+chat log queries. Each profile runs against a fresh temporary database.
+
+    python bench/bench_sqlite.py --writers 4 --readers 4 --seconds 5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from peewee import OperationalError
+
+from model import db, ChatLog, SQLITE_PRAGMAS, initialize_db, record_chats, get_counters
+
+PROFILES = {
+    "default": {},
+    "tuned": SQLITE_PRAGMAS,
+}
+
+
+def run_profile(pragmas, writers, readers, seconds, seed_rows):
+    path = os.path.join(tempfile.mkdtemp(prefix="stubot-bench-"), "bench.db")
+    # The baseline gets peewee's default 5 s timeout but none of the pragmas
+    db.init(path, pragmas=pragmas)
+    initialize_db()
+    record_chats([make_log(i) for i in range(seed_rows)])
+    db.close()
+
+    stop = threading.Event()
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def writer(n):
+        i = 0
+        while not stop.is_set():
+            try:
+                record_chats([make_log(n * 10**9 + i)])
+                key = "writes"
+            except OperationalError:
+                key = "errors"
+            i += 1
+            with lock:
+                counts[key] += 1
+        db.close()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                get_counters()
+                list(
+                    ChatLog.select()
+                    .order_by(ChatLog.timestamp.desc(), ChatLog.id.desc())
+                    .limit(10)
+                )
+                key = "reads"
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+        db.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {k: v / seconds for k, v in counts.items()}
+
+
+def make_log(i):
+    return {
+        "user_id": f"user_{i % 97}",
+        "user_message": f"where is the library {i}",
+        "bot_response": "The university library opens from 9am to 8pm on weekdays.",
+        "user_audio_filename": None,
+        "bot_audio_filename": None,
+        "timestamp": datetime.utcnow(),
+        "status": "answered",
+        "intent": "library",
+        "confidence": 0.9,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite profile benchmark")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--seed-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'writes/s':>12}{'reads/s':>12}{'errors/s':>12}")
+    results = {}
+    for name, pragmas in PROFILES.items():
+        r = results[name] = run_profile(
+            pragmas, args.writers, args.readers, args.seconds, args.seed_rows
+        )
+        print(f"{name:<10}{r['writes']:>12.0f}{r['reads']:>12.0f}{r['errors']:>12.1f}")
+    # Writers queue on busy_timeout, so the tuned profile must never lose one
+    assert results["tuned"]["errors"] == 0, "tuned profile failed writes"
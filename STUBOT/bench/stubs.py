@@ -0,0 +1,197 @@
+# bench/stubs.py
+"""
+Local stand-ins for the external services /chat depends on, so load
+tests measure the app rather than the network.
+
+StubRasa answers the REST webhook (plus /status and /model/parse, which
+the app also calls) from domain.yml after a configurable delay: a message
+naming an intent gets that intent's utter_ response, anything else the
+fallback. stub_tts() returns a TTSCache synthesizer that burns a fixed
+amount of time and writes a fixed-size file instead of calling gTTS.
+
+Run the Rasa stub on its own to point a real app at it:
+
+    python bench/stubs.py --port 5005 --latency-ms 80 --jitter-ms 40
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from domain import DOMAIN_FILE, load_domain, load_responses
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 drops bursts of connects
+
+
+def domain_intents(path=DOMAIN_FILE):
+    """{intent: [reply, ...]} for every intent with an utter_<intent> response."""
+    responses = load_responses(path)
+    return {
+        intent: responses[f"utter_{intent}"]
+        for intent in load_domain(path).get("intents") or []
+        if f"utter_{intent}" in responses
+    }
+
+
+class StubRasa:
+    """
+    Threaded HTTP server imitating `rasa run --enable-api`.
+
+    latency_ms (+ uniform jitter_ms) is slept before every webhook reply;
+    reply_chars > 0 pads or truncates replies to that length; a
+    unique_replies fraction of replies get a serial number appended, so
+    they miss the TTS and response caches like unseen answers would.
+    """
+
+    def __init__(
+        self,
+        port=0,
+        latency_ms=50.0,
+        jitter_ms=0.0,
+        reply_chars=0,
+        unique_replies=0.0,
+        domain_path=DOMAIN_FILE,
+        seed=0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.reply_chars = reply_chars
+        self.unique_replies = unique_replies
+        self.intents = domain_intents(domain_path)
+        self.fallback = load_responses(domain_path).get("utter_fallback") or [
+            "Sorry, I didn't get that."
+        ]
+        # Longest names first so "student_life" wins over "student"
+        self._words = sorted(
+            ((name, name.replace("_", " ")) for name in self.intents),
+            key=lambda item: -len(item[1]),
+        )
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._serial = 0
+        self.requests = 0
+        self.server = _Server(("127.0.0.1", port), self._handler())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/webhooks/rest/webhook"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def classify(self, message):
+        text = message.lower()
+        for name, words in self._words:
+            if words in text:
+                return name, 0.95
+        return "nlu_fallback", 0.3
+
+    def parse(self, text):
+        intent, confidence = self.classify(text)
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+        time.sleep(delay / 1000)
+        return {"text": text, "intent": {"name": intent, "confidence": confidence}}
+
+    def reply(self, sender, message):
+        intent, _ = self.classify(message)
+        with self._lock:
+            self.requests += 1
+            text = self._rng.choice(self.intents.get(intent) or self.fallback)
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            if self._rng.random() < self.unique_replies:
+                self._serial += 1
+                text = f"{text} ({self._serial})"
+        if self.reply_chars:
+            text = (text + " ") * (self.reply_chars // (len(text) + 1) + 1)
+            text = text[: self.reply_chars]
+        time.sleep(delay / 1000)
+        return [{"recipient_id": sender, "text": text}]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+            # Headers and body go out in separate writes; with Nagle on, a
+            # reused connection stalls on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                )
+                if self.path.startswith("/model/parse"):
+                    return self._json(stub.parse(body.get("text", "")))
+                self._json(stub.reply(body.get("sender", ""), body.get("message", "")))
+
+            def do_GET(self):
+                if self.path.startswith("/status"):
+                    return self._json({"model_file": "stub-model.tar.gz"})
+                self._json({"error": "not found"}, 404)
+
+            def _json(self, data, status=200):
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def stub_tts(cost_ms=300.0, size_bytes=24 * 1024):
+    """A TTSCache synthesizer that sleeps cost_ms and writes size_bytes."""
+    payload = b"\xff\xfb" + b"\0" * max(0, size_bytes - 2)  # mp3 frame sync
+
+    def synthesize(text, path, lang="en", tld="com", slow=False):
+        time.sleep(cost_ms / 1000)
+        with open(path, "wb") as f:
+            f.write(payload)
+
+    return synthesize
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Rasa REST server")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--reply-chars", type=int, default=0)
+    parser.add_argument("--unique-replies", type=float, default=0.0)
+    parser.add_argument("--domain", default=DOMAIN_FILE)
+    args = parser.parse_args()
+
+    stub = StubRasa(
+        args.port,
+        args.latency_ms,
+        args.jitter_ms,
+        args.reply_chars,
+        args.unique_replies,
+        args.domain,
+    )
+    print(f"Stub Rasa on {stub.url} ({len(stub.intents)} intents)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
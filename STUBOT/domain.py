@@ -0,0 +1,41 @@
+# domain.py
+import yaml
+
+DOMAIN_FILE = "domain.yml"
+
+
+def load_domain(path=DOMAIN_FILE):
+    """Parse the Rasa domain file into a dict."""
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_responses(path=DOMAIN_FILE):
+    """
+    Return {utter_name: [text, ...]} for every text variant listed under
+    `responses:` in the domain file. Variants without text are skipped.
+    """
+    responses = load_domain(path).get("responses") or {}
+    result = {}
+    for name, variants in responses.items():
+        texts = [
+            v["text"] for v in variants or [] if isinstance(v, dict) and v.get("text")
+        ]
+        if texts:
+            result[name] = texts
+    return result
+
+
+# Responses that depend on the conversation (or signal a miss) rather than
+# answering a standalone question.
+STATEFUL_RESPONSES = ("utter_greet", "utter_goodbye", "utter_fallback", "utter_default")
+
+
+def single_turn_texts(path=DOMAIN_FILE, exclude=STATEFUL_RESPONSES):
+    """Set of reply texts that answer a standalone FAQ question."""
+    return {
+        text
+        for name, texts in load_responses(path).items()
+        if name not in exclude
+        for text in texts
+    }
@@ -0,0 +1,115 @@
+# export.py
+import csv
+import io
+import json
+import zlib
+
+from peewee import Tuple
+
+from model import ChatLog, encode_cursor
+
+FORMATS = ("csv", "jsonl")
+FIELDS = (
+    "id",
+    "timestamp",
+    "user_id",
+    "user_message",
+    "bot_response",
+    "status",
+    "intent",
+    "confidence",
+    "user_audio_filename",
+    "bot_audio_filename",
+    "user_audio_duration",
+    "user_audio_size",
+)
+CHUNK_SIZE = 64 * 1024  # bytes per chunk handed to the response
+
+
+def iter_logs(start=None, end=None, after=None, batch_size=2000):
+    """
+    Yield ChatLog rows as dicts in (timestamp, id) order, from `start`
+    (inclusive) to `end` (exclusive), resuming after the `after` cursor.
+
+    Rows are read in keyset batches with .iterator(), so memory stays flat
+    and no read transaction is held open for the whole export.
+    """
+    while True:
+        query = ChatLog.select(*[getattr(ChatLog, f) for f in FIELDS])
+        # Once past start the cursor alone bounds the range; both together
+        # would have SQLite scan from start again for every batch
+        if start is not None and (after is None or after[0] < start):
+            query = query.where(ChatLog.timestamp >= start)
+        if end is not None:
+            query = query.where(ChatLog.timestamp < end)
+        if after is not None:
+            ts, log_id = after
+            # Row-value form, so each batch is an index range rather than
+            # a rescan from the start
+            query = query.where(
+                Tuple(ChatLog.timestamp, ChatLog.id) > Tuple(ts, log_id)
+            )
+        query = query.order_by(ChatLog.timestamp, ChatLog.id).limit(batch_size)
+
+        count = 0
+        for row in query.dicts().iterator():
+            count += 1
+            yield row
+        if count < batch_size:
+            return
+        after = (row["timestamp"], row["id"])
+
+
+def _serialise(row):
+    row = dict(row, cursor=encode_cursor(row))
+    row["timestamp"] = row["timestamp"].isoformat()
+    return row
+
+
+def csv_lines(rows):
+    """CSV text chunks, header first. The last column is the resume cursor."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS + ("cursor",))
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(_serialise(row))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_lines(rows):
+    """One JSON object per line, each with its resume cursor."""
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps(_serialise(row), ensure_ascii=False) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    yield "".join(chunk)
+
+
+def encode(chunks, compress=False):
+    """UTF-8 encode text chunks, gzip-compressing them on the fly if asked."""
+    if not compress:
+        for chunk in chunks:
+            if chunk:
+                yield chunk.encode("utf-8")
+        return
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = gz.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield gz.flush()
+
+
+def export_logs(fmt="csv", start=None, end=None, after=None, compress=False):
+    """Byte chunks of the chat logs in the given format."""
+    lines = csv_lines if fmt == "csv" else jsonl_lines
+    return encode(lines(iter_logs(start, end, after)), compress)
@@ -0,0 +1,177 @@
+# faq_index.py
+import os
+import re
+import threading
+
+import numpy as np
+import yaml
+from scipy import sparse
+
+from domain import DOMAIN_FILE, load_responses
+
+NLU_FILE = os.path.join("data", "nlu.yml")
+NOT_ANSWERS = ("utter_fallback", "utter_default")
+
+
+def char_wb_ngrams(text, min_n=1, max_n=4):
+    """
+    Character n-grams taken inside word boundaries, padded with spaces, the
+    same way Rasa's CountVectorsFeaturizer (analyzer: char_wb) builds them.
+    """
+    grams = []
+    for word in text.lower().split():
+        padded = f" {word} "
+        for n in range(min_n, max_n + 1):
+            if n > len(padded):
+                break
+            grams.extend(padded[i : i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+def load_nlu_examples(path=NLU_FILE):
+    """Return {intent: [example, ...]} from a Rasa 3.x nlu.yml, if present."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    examples = {}
+    for block in data.get("nlu") or []:
+        if "intent" not in block:
+            continue
+        lines = (block.get("examples") or "").splitlines()
+        # Strip the "- " list marker and [entity](type) annotations
+        texts = [
+            re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", line.strip()[2:])
+            for line in lines
+            if line.strip().startswith("- ")
+        ]
+        examples.setdefault(block["intent"], []).extend(texts)
+    return examples
+
+
+class FaqIndex:
+    """
+    In-process TF-IDF retrieval over the domain responses and the NLU
+    training examples of each intent (`utter_<intent>` <- `<intent>`).
+
+    The index is a sparse L2-normalised char_wb 1-4 gram matrix built once.
+    A query only gathers the matrix columns of its own n-grams, so it is
+    answered in well under a millisecond and keeps working when the Rasa
+    server does not.
+    """
+
+    def __init__(self, domain_path=DOMAIN_FILE, nlu_path=NLU_FILE):
+        self.responses = {
+            name: texts
+            for name, texts in load_responses(domain_path).items()
+            if name not in NOT_ANSWERS
+        }
+        self.response_for_text = {
+            text: name for name, texts in self.responses.items() for text in texts
+        }
+        examples = load_nlu_examples(nlu_path)
+
+        labels, docs = [], []
+        for name, texts in self.responses.items():
+            intent = self.intent(name)
+            for text in examples.get(intent, []) + texts + [intent.replace("_", " ")]:
+                labels.append(name)
+                docs.append(text)
+        self.labels = labels
+
+        vocab = {}
+        rows, cols = [], []
+        for row, doc in enumerate(docs):
+            for gram in char_wb_ngrams(doc):
+                rows.append(row)
+                cols.append(vocab.setdefault(gram, len(vocab)))
+        self.vocab = vocab
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(docs), len(vocab)),
+        )
+        counts.sum_duplicates()
+        df = np.bincount(counts.indices, minlength=len(vocab))
+        self.idf = (np.log((1 + len(docs)) / (1 + df)) + 1).astype(np.float32)
+        matrix = self._normalise(counts.multiply(self.idf)).tocsc()
+        # Column-major arrays: a query only touches the columns of its n-grams
+        self._indptr = matrix.indptr
+        self._rows = matrix.indices
+        self._weights = matrix.data
+
+        self.compared = 0
+        self.agreed = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(m):
+        norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ m.tocsr()
+
+    def scores(self, message):
+        """Cosine similarity of message against every indexed document."""
+        cols = [self.vocab[g] for g in char_wb_ngrams(message) if g in self.vocab]
+        if not cols:
+            return None
+        cols, counts = np.unique(cols, return_counts=True)
+        query = counts * self.idf[cols]
+        query /= np.sqrt(query @ query)
+
+        # Gather the non-zeros of the query's columns and scatter-add per row
+        starts, ends = self._indptr[cols], self._indptr[cols + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        nz = offsets + np.arange(lengths.sum())
+        return np.bincount(
+            self._rows[nz],
+            weights=self._weights[nz] * np.repeat(query, lengths),
+            minlength=len(self.labels),
+        )
+
+    def predict(self, message):
+        """Return (response_name, cosine score) for the best match, or (None, 0.0)."""
+        scores = self.scores(message)
+        if scores is None:
+            return None, 0.0
+        best = int(scores.argmax())
+        return self.labels[best], float(scores[best])
+
+    def match(self, message, threshold):
+        """(response_name, score) of the best match; name is None below threshold."""
+        name, score = self.predict(message)
+        if name is None or score < threshold:
+            return None, score
+        return name, score
+
+    def answer(self, message, threshold):
+        """Reply text for message if the match scores at least threshold."""
+        name, _ = self.match(message, threshold)
+        return self.responses[name][0] if name else None
+
+    @staticmethod
+    def intent(name):
+        """The intent a response answers (`utter_<intent>` -> `<intent>`)."""
+        return name[len("utter_") :] if name.startswith("utter_") else name
+
+    def record_agreement(self, message, rasa_text):
+        """Compare our top-1 with the response Rasa actually gave."""
+        rasa_name = self.response_for_text.get(rasa_text)
+        if rasa_name is None:
+            return
+        name, _ = self.predict(message)
+        with self._lock:
+            self.compared += 1
+            self.agreed += name == rasa_name
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self.labels),
+                "features": len(self.vocab),
+                "compared": self.compared,
+                "agreed": self.agreed,
+                "top1_agreement": (
+                    (self.agreed / self.compared) if self.compared else 0.0
+                ),
+            }
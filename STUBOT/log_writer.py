@@ -0,0 +1,160 @@
+# log_writer.py
+import queue
+import threading
+import time
+
+# What enqueue() does when the queue is full
+POLICY_SYNC = "sync"  # write the record on the caller's thread (no loss)
+POLICY_BLOCK = "block"  # wait up to block_timeout for space, then drop
+POLICY_DROP = "drop"  # drop the record immediately
+POLICIES = (POLICY_SYNC, POLICY_BLOCK, POLICY_DROP)
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Write-behind chat logger.
+
+    Requests enqueue log dicts into a bounded queue; one flusher thread
+    writes them with write_batch (e.g. model.record_chats) in a single
+    transaction per batch, whenever batch_size records are waiting or
+    flush_interval seconds have passed. close() drains the queue.
+    """
+
+    def __init__(
+        self,
+        write_batch,
+        max_queue=10000,
+        batch_size=200,
+        flush_interval=0.05,
+        policy=POLICY_SYNC,
+        block_timeout=0.5,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown log queue policy {policy!r}")
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.written_sync = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def enqueue(self, record):
+        """Queue one log record; returns False if it was dropped."""
+        if self._closed:
+            return self._write_sync(record)
+        try:
+            if self.policy == POLICY_BLOCK:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == POLICY_SYNC:
+                return self._write_sync(record)
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _write_sync(self, record):
+        self._flush([record])
+        with self._lock:
+            self.written_sync += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        written = 0
+        try:
+            self.write_batch(batch)
+            written = len(batch)
+        except Exception as e:
+            print(f"Error writing {len(batch)} chat log(s) to database: {e}")
+            if len(batch) > 1:
+                # Retry one by one so a single bad record doesn't lose the batch
+                for record in batch:
+                    try:
+                        self.write_batch([record])
+                        written += 1
+                    except Exception:
+                        pass
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.batches += 1
+            self.written += written
+            self.failed += len(batch) - written
+            self.last_flush_seconds = elapsed
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def close(self, timeout=10):
+        """Stop accepting work and write out everything still queued."""
+        if self._closed:
+            return
+        self._closed = True
+        # The flusher exits after the sentinel, so everything before it is written
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_max": self._queue.maxsize,
+                "policy": self.policy,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "written_sync": self.written_sync,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "last_flush_seconds": self.last_flush_seconds,
+                "avg_flush_seconds": (
+                    self.flush_seconds_total / self.batches if self.batches else 0.0
+                ),
+                "max_flush_seconds": self.flush_seconds_max,
+            }
@@ -0,0 +1,174 @@
+# metrics.py
+"""
+Counters and histograms rendered in the Prometheus text format (0.0.4),
+for the /metrics endpoint.
+
+Request and stage timings are recorded as they happen; the counters the
+caches, Rasa client and log writer already keep are read through
+collectors at scrape time instead of being counted twice.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans a cache hit through a slow gTTS call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(
+                    f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+                )
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        # Buckets are cumulative when rendered, so count each value once
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block takes, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q, **labels):
+        """
+        Estimate the q-quantile by interpolating inside the bucket it falls
+        in, like Prometheus' histogram_quantile(). None if nothing was
+        observed.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = list(self._series.get(key) or ())
+        if not series or not series[-1]:
+            return None
+        rank = q * series[-1]
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(self.buckets, series):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower  # in the +Inf bucket: the largest finite bound
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                labels = _labels(self.labelnames, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(values[-2])}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, prefix, stats, counters=(), gauges=()):
+        """
+        Export fields of a component's stats() dict at scrape time:
+        `counters` as <prefix>_<field>_total, `gauges` as <prefix>_<field>.
+        """
+        self._collectors.append((prefix, stats, counters, gauges))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats, counters, gauges in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting {prefix} metrics: {e}")
+                continue
+            for field, kind, suffix in [(f, "counter", "_total") for f in counters] + [
+                (f, "gauge", "") for f in gauges
+            ]:
+                value = values.get(field)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{field}{suffix}"
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,150 @@
+# migrate.py
+"""
+Schema migrations for an existing chatbot_logs.db.
+
+apply_schema() is cheap and idempotent and runs from initialize_db() on
+every start. Backfills touch every row, so they are run by hand:
+
+    python migrate.py backfill-status --batch-size 500
+    python migrate.py search-index    # rebuild and optimize the FTS index
+"""
+
+import argparse
+
+from playhouse.migrate import SchemaMigrator, migrate
+
+from model import (
+    db,
+    write_transaction,
+    ChatLog,
+    ChatLogIndex,
+    search_enabled,
+    status_from_response,
+    rebuild_counters,
+)
+
+# Columns added to ChatLog after its first release, in order
+CHATLOG_COLUMNS = (
+    "status",
+    "intent",
+    "confidence",
+    "user_audio_duration",
+    "user_audio_size",
+)
+
+# Keep the external-content FTS index in step with chatlog
+SEARCH_INDEX_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS chatlog_ai AFTER INSERT ON chatlog BEGIN
+      INSERT INTO chatlogindex(rowid, user_message, bot_response)
+      VALUES (new.id, new.user_message, new.bot_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatlog_ad AFTER DELETE ON chatlog BEGIN
+      INSERT INTO chatlogindex(chatlogindex, rowid, user_message, bot_response)
+      VALUES ('delete', old.id, old.user_message, old.bot_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatlog_au
+    AFTER UPDATE OF user_message, bot_response ON chatlog BEGIN
+      INSERT INTO chatlogindex(chatlogindex, rowid, user_message, bot_response)
+      VALUES ('delete', old.id, old.user_message, old.bot_response);
+      INSERT INTO chatlogindex(rowid, user_message, bot_response)
+      VALUES (new.id, new.user_message, new.bot_response);
+    END""",
+)
+
+
+def apply_schema():
+    """Add any missing ChatLog columns and indexes."""
+    table = ChatLog._meta.table_name
+    migrator = SchemaMigrator.from_database(db)
+    columns = {c.name for c in db.get_columns(table)}
+    indexes = {i.name for i in db.get_indexes(table)}
+
+    operations = []
+    for name in CHATLOG_COLUMNS:
+        if name not in columns:
+            # add_column also creates the field's own index (index=True)
+            operations.append(
+                migrator.add_column(table, name, ChatLog._meta.fields[name])
+            )
+            indexes.add(f"{table}_{name}")
+    if f"{table}_status" not in indexes:
+        operations.append(migrator.add_index(table, ("status",), False))
+    if f"{table}_timestamp_id" not in indexes:
+        operations.append(migrator.add_index(table, ("timestamp", "id"), False))
+    if operations:
+        with write_transaction():
+            migrate(*operations)
+        print(f"Applied {len(operations)} schema change(s) to {table}.")
+
+
+def apply_search_index(rebuild=False):
+    """
+    Create the full-text index and its triggers if missing (SQLite only),
+    indexing any existing rows. rebuild=True re-indexes from scratch.
+    """
+    with write_transaction():
+        created = not ChatLogIndex.table_exists()
+        if created:
+            ChatLogIndex.create_table()
+        for sql in SEARCH_INDEX_TRIGGERS:
+            db.execute_sql(sql)
+        if created or rebuild:
+            ChatLogIndex.rebuild()
+    if created and ChatLog.select().exists():
+        print("Built the chat log search index.")
+
+
+def backfill_status(batch_size=500, fallback_texts=()):
+    """
+    Fill ChatLog.status for rows logged before it existed, batch_size rows
+    per transaction so writers are never locked out for long.
+    Returns the number of rows updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        with write_transaction():
+            rows = list(
+                ChatLog.select(ChatLog.id, ChatLog.bot_response)
+                .where(ChatLog.status.is_null(), ChatLog.id > last_id)
+                .order_by(ChatLog.id)
+                .limit(batch_size)
+            )
+            if not rows:
+                break
+            by_status = {}
+            for row in rows:
+                status = status_from_response(row.bot_response, fallback_texts)
+                by_status.setdefault(status, []).append(row.id)
+            for status, ids in by_status.items():
+                ChatLog.update(status=status).where(ChatLog.id.in_(ids)).execute()
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
+
+
+if __name__ == "__main__":
+    from domain import load_responses
+
+    parser = argparse.ArgumentParser(description="Database migrations")
+    parser.add_argument(
+        "command", choices=["schema", "backfill-status", "search-index"]
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--domain", default="domain.yml")
+    args = parser.parse_args()
+
+    db.connect(reuse_if_open=True)
+    apply_schema()
+    if args.command == "backfill-status":
+        fallback_texts = set(load_responses(args.domain).get("utter_fallback", []))
+        count = backfill_status(args.batch_size, fallback_texts)
+        # Fallbacks used to be counted as answered; recount with the new statuses
+        rebuild_counters()
+        print(f"Backfilled status for {count} chat log(s).")
+    elif args.command == "search-index":
+        if not search_enabled():
+            parser.error("search-index needs the SQLite database")
+        apply_search_index(rebuild=True)
+        ChatLogIndex.optimize()
+        print("Rebuilt and optimized the chat log search index.")
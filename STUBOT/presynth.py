@@ -0,0 +1,130 @@
+# presynth.py
+"""
+Pre-render every response in domain.yml to audio.
+
+Run after editing the domain (or as part of a deploy):
+
+    python presynth.py --domain domain.yml --workers 8
+    python presynth.py --backend espeak    # offline voice, see tts_backends.py
+
+Audio is written through the TTS cache and a manifest mapping response
+text to its file is saved next to it. chat() serves audio straight from
+that manifest. Responses whose text is unchanged since the last build are
+skipped. The manifest is only used while the app runs the TTS backend it
+was built with.
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from domain import DOMAIN_FILE, load_responses
+from tts_backends import make_backend
+from tts_cache import TTSCache
+
+MANIFEST_NAME = "tts_manifest.json"
+
+
+def manifest_path(folder):
+    return os.path.join(folder, MANIFEST_NAME)
+
+
+def load_manifest(folder, backend="gtts"):
+    """
+    Return {text: filename} from the manifest, or {} if there isn't one or
+    it was rendered by another backend.
+    """
+    try:
+        with open(manifest_path(folder), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("backend", "gtts") != backend:
+        return {}
+    entries = manifest.get("entries", {})
+    return {
+        text: entry["file"]
+        for text, entry in entries.items()
+        if os.path.exists(os.path.join(folder, entry["file"]))
+    }
+
+
+def build(cache, domain_path=DOMAIN_FILE, workers=4, lang="en", tld="com", slow=False):
+    """
+    Render all domain responses into cache.folder and rewrite the manifest.
+    Returns (rendered, skipped, failed) counts.
+    """
+    previous = load_manifest(cache.folder, cache.backend.name)
+    texts = {}
+    for name, variants in load_responses(domain_path).items():
+        for text in variants:
+            texts.setdefault(text, name)
+
+    entries = {}
+    todo = []
+    for text, name in texts.items():
+        key = cache.key(text, lang, tld, slow)
+        filename = cache.filename_for(key)
+        entries[text] = {"response": name, "key": key, "file": filename}
+        if previous.get(text) != filename:
+            todo.append(text)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(cache.get, text, lang=lang, tld=tld, slow=slow): text
+            for text in todo
+        }
+        for future in as_completed(futures):
+            text = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                entries.pop(text)
+                print(f"Error rendering {texts[text]}: {e}")
+
+    tmp = manifest_path(cache.folder) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "backend": cache.backend.name,
+                "lang": lang,
+                "tld": tld,
+                "slow": slow,
+                "entries": entries,
+            },
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )
+    os.replace(tmp, manifest_path(cache.folder))
+    return len(todo) - failed, len(texts) - len(todo), failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--domain", default=DOMAIN_FILE)
+    parser.add_argument("--audio-folder", default="static/audio")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--tld", default="com")
+    parser.add_argument(
+        "--backend",
+        default=os.environ.get("TTS_BACKEND", "gtts"),
+        help="gtts or espeak",
+    )
+    parser.add_argument("--voice", default=os.environ.get("TTS_VOICE"))
+    args = parser.parse_args()
+
+    backend = make_backend(args.backend, workers=args.workers, voice=args.voice)
+    # The bundle is pinned at runtime, so don't let the build evict anything
+    cache = TTSCache(args.audio_folder, max_bytes=float("inf"), backend=backend)
+    try:
+        rendered, skipped, failed = build(
+            cache, args.domain, workers=args.workers, lang=args.lang, tld=args.tld
+        )
+    finally:
+        backend.close()
+    print(f"Rendered {rendered}, unchanged {skipped}, failed {failed}.")
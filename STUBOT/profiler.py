@@ -0,0 +1,110 @@
+# profiler.py
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler that can be switched on and off while the
+    app is serving.
+
+    While running, a daemon thread snapshots every other thread's stack
+    each `interval` seconds and counts identical stacks. The result is in
+    the "collapsed" format (frame;frame;frame count) that flamegraph.pl
+    and speedscope read. Nothing is traced, so requests pay no per-call
+    overhead, and none at all while the profiler is stopped.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64, max_stacks=20000):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self.started_at = None
+        self.seconds = 0.0  # time spent running, over all start/stop cycles
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        with self._lock:
+            if self._thread is not None:
+                return False
+            if interval:
+                self.interval = interval
+            self._stop.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(
+                target=self._run, name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return False
+        self._stop.set()
+        thread.join()
+        self.seconds += time.time() - self.started_at
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.seconds = 0.0
+            if self._thread is not None:
+                self.started_at = time.time()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = [
+                self._collapse(frame)
+                for ident, frame in sys._current_frames().items()
+                if ident != me
+            ]
+            with self._lock:
+                self.samples += 1
+                for stack in stacks:
+                    if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[stack] += 1
+                    else:
+                        self._stacks["[other]"] += 1
+
+    def _collapse(self, frame):
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            name = os.path.basename(code.co_filename)
+            frames.append(f"{code.co_name} ({name}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    def collapsed(self, limit=None):
+        """The most frequent stacks, one "stack count" line each."""
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self):
+        with self._lock:
+            running = self._thread is not None
+            return {
+                "running": running,
+                "interval_ms": self.interval * 1000,
+                "samples": self.samples,
+                "stacks": len(self._stacks),
+                "seconds": self.seconds
+                + (time.time() - self.started_at if running else 0.0),
+            }
@@ -0,0 +1,210 @@
+# rasa_client.py
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RasaUnavailable(Exception):
+    """Raised without contacting Rasa while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_timeout seconds. After that a single trial call is let through
+    (half-open); its outcome closes the breaker or opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            # Half-open: a trial call is already in flight
+            return False
+
+    def is_closed(self):
+        """Whether calls go through normally; unlike allow(), never starts a trial."""
+        with self._lock:
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class RasaClient:
+    """
+    Shared keep-alive client for the Rasa REST webhook.
+
+    Connections are pooled across requests. Only connection failures and
+    gateway errors are retried, so a message is never processed twice by
+    Rasa after it has been read.
+    """
+
+    def __init__(
+        self,
+        url,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        parse_timeout=2.0,
+        retries=2,
+        pool_size=20,
+        failure_threshold=5,
+        reset_timeout=30.0,
+    ):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.parse_timeout = parse_timeout
+        self.retries = retries
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            backoff_factor=0.2,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._latencies = deque(maxlen=1000)  # recent call durations
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Raise RasaUnavailable (and count it) while the breaker is open."""
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise RasaUnavailable("Rasa circuit breaker is open")
+
+    def send_message(self, sender, message):
+        """POST a message to the webhook and return Rasa's list of replies."""
+        self.admit()
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.url,
+                json={"sender": sender, "message": message},
+                timeout=self.timeout,
+            )
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            self.record(time.perf_counter() - start, failed=True)
+            raise
+        self.breaker.record_success()
+        self.record(time.perf_counter() - start)
+
+        response.raise_for_status()
+        return response.json()
+
+    def model_fingerprint(self):
+        """
+        Identify the model the server has loaded (GET /status, which needs
+        `rasa run --enable-api`). Returns None if it can't be determined.
+        """
+        status_url = self.url.split("/webhooks/")[0] + "/status"
+        try:
+            response = self.session.get(status_url, timeout=self.timeout)
+            response.raise_for_status()
+            status = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        fingerprint = status.get("fingerprint")
+        return status.get("model_file") or (repr(fingerprint) if fingerprint else None)
+
+    def parse(self, text):
+        """
+        (intent, confidence) Rasa's NLU assigns to text, from /model/parse
+        (needs `--enable-api`); (None, None) on error or unless the breaker
+        is closed. Bounded by parse_timeout, as it is only needed for the log.
+
+        The breaker guards the webhook users wait on, so this lookup only
+        reads it: a slow /model/parse must not make chats "unavailable".
+        """
+        if not self.breaker.is_closed():
+            return None, None
+        base = self.url.split("/webhooks/")[0]
+        try:
+            response = self.session.post(
+                f"{base}/model/parse",
+                json={"text": text},
+                timeout=(self.timeout[0], self.parse_timeout),
+            )
+            response.raise_for_status()
+            intent = response.json().get("intent") or {}
+        except (requests.exceptions.RequestException, ValueError):
+            return None, None
+        return intent.get("name"), intent.get("confidence")
+
+    def record(self, seconds, failed=False):
+        """Count one webhook call (asgi.py's async client reports here too)."""
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self._latencies.append(seconds)
+
+    def stats(self):
+        with self._lock:
+            recent = sorted(self._latencies)
+            calls = self.calls
+
+            def pct(p):
+                return (
+                    recent[min(len(recent) - 1, int(p * len(recent)))]
+                    if recent
+                    else 0.0
+                )
+
+            return {
+                "calls": calls,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "breaker": self.breaker.state,
+                "avg_seconds": (self.total_seconds / calls) if calls else 0.0,
+                "p50_seconds": pct(0.50),
+                "p95_seconds": pct(0.95),
+                "max_seconds": self.max_seconds,
+            }
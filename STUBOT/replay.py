@@ -0,0 +1,310 @@
+# replay.py
+"""
+Replay logged chat messages against a candidate Rasa model before deploying it.
+
+    python replay.py --candidate http://localhost:5006
+    python replay.py --candidate http://localhost:5006 \\
+        --current http://localhost:5005 --since 2025-01-01 --report replay.csv
+
+Each logged user message is sent to the candidate's /model/parse, and to
+the current server's if --current is given. Without --current the intent
+and confidence logged at chat time are the baseline. Intent, confidence,
+fallback and latency are recorded per query. The summary compares the
+two models: fallback rate, confidence, latency percentiles and which
+intents moved where.
+
+Logs are read in keyset batches and at most 4 x --workers queries are in
+flight. Per-query rows go straight to the --report CSV and only totals
+are kept, so memory stays flat however many messages are replayed.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from export import iter_logs
+from metrics import Histogram
+from model import db
+
+FALLBACK_INTENT = "nlu_fallback"
+# 1 ms to ~1 min in 10% steps, so percentiles are within 10%
+LATENCY_BUCKETS = tuple(0.001 * 1.1**i for i in range(116))
+REPORT_FIELDS = (
+    "id",
+    "timestamp",
+    "user_message",
+    "current_intent",
+    "current_confidence",
+    "current_ms",
+    "candidate_intent",
+    "candidate_confidence",
+    "candidate_ms",
+    "changed",
+)
+
+
+class ParseClient:
+    """POSTs text to a Rasa server's /model/parse (needs --enable-api)."""
+
+    def __init__(self, url, pool_size=16, timeout=10.0):
+        # Accept the webhook URL the app is configured with as well
+        self.url = url.split("/webhooks/")[0].rstrip("/") + "/model/parse"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+
+    def parse(self, text):
+        """(intent, confidence, seconds); raises on HTTP or connection errors."""
+        start = time.perf_counter()
+        response = self.session.post(
+            self.url, json={"text": text}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        seconds = time.perf_counter() - start
+        intent = response.json().get("intent") or {}
+        return intent.get("name"), intent.get("confidence"), seconds
+
+
+class ModelStats:
+    """Running totals for one side of the comparison."""
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.errors = 0
+        self.unknown = 0  # no intent, e.g. logged while /model/parse was down
+        self.fallbacks = 0
+        self.confidence_sum = 0.0
+        self.latency = Histogram(f"{name}_latency", "", buckets=LATENCY_BUCKETS)
+
+    def add(self, result):
+        self.queries += 1
+        if result is None:
+            self.errors += 1
+            return
+        intent, confidence, seconds = result
+        if intent is None:
+            self.unknown += 1
+            return
+        self.fallbacks += intent == FALLBACK_INTENT
+        self.confidence_sum += confidence or 0.0
+        if seconds is not None:
+            self.latency.observe(seconds)
+
+    def summary(self):
+        answered = self.queries - self.errors - self.unknown
+        return {
+            "queries": self.queries,
+            "errors": self.errors,
+            "unknown": self.unknown,
+            "fallback_rate": self.fallbacks / answered if answered else 0.0,
+            "mean_confidence": self.confidence_sum / answered if answered else 0.0,
+            **{
+                f"p{int(q * 100)}_ms": _ms(self.latency.quantile(q))
+                for q in (0.5, 0.95, 0.99)
+            },
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _try_parse(client, text):
+    try:
+        return client.parse(text)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error parsing with {client.url}: {e}", file=sys.stderr)
+        return None
+
+
+def replay_one(row, candidate, current):
+    """(row, current result, candidate result); a result is None on error."""
+    if current is None:
+        baseline = (row["intent"], row["confidence"], None)
+    else:
+        baseline = _try_parse(current, row["user_message"])
+    return row, baseline, _try_parse(candidate, row["user_message"])
+
+
+def replay(
+    candidate,
+    current=None,
+    start=None,
+    end=None,
+    limit=None,
+    workers=16,
+    report=None,
+    changes_only=False,
+):
+    """
+    Replay logs from start to end against the candidate ParseClient (and
+    the current one, or the logged intents if None). Writes per-query rows
+    to the `report` file object if given; returns the summary dict.
+    """
+    stats = {"current": ModelStats("current"), "candidate": ModelStats("candidate")}
+    moved = Counter()  # (current intent, candidate intent) -> queries
+    compared = agreed = new_fallbacks = recovered = 0
+    writer = None
+    if report is not None:
+        writer = csv.DictWriter(report, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+
+    def record(row, baseline, result):
+        nonlocal compared, agreed, new_fallbacks, recovered
+        stats["current"].add(baseline)
+        stats["candidate"].add(result)
+        if baseline is None or result is None or baseline[0] is None:
+            changed = None  # nothing to compare against
+        else:
+            compared += 1
+            changed = baseline[0] != result[0]
+            if changed:
+                moved[(baseline[0], result[0])] += 1
+                new_fallbacks += result[0] == FALLBACK_INTENT
+                recovered += baseline[0] == FALLBACK_INTENT
+            else:
+                agreed += 1
+        if writer is not None and (changed or not changes_only):
+            baseline = baseline or (None, None, None)
+            result = result or (None, None, None)
+            writer.writerow(
+                {
+                    "id": row["id"],
+                    "timestamp": row["timestamp"].isoformat(),
+                    "user_message": row["user_message"],
+                    "current_intent": baseline[0],
+                    "current_confidence": baseline[1],
+                    "current_ms": _ms(baseline[2]),
+                    "candidate_intent": result[0],
+                    "candidate_confidence": result[1],
+                    "candidate_ms": _ms(result[2]),
+                    "changed": changed,
+                }
+            )
+
+    started = time.perf_counter()
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for n, row in enumerate(iter_logs(start, end)):
+            if limit is not None and n >= limit:
+                break
+            pending.add(pool.submit(replay_one, row, candidate, current))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(*future.result())
+        for future in pending:
+            record(*future.result())
+    seconds = time.perf_counter() - started
+
+    queries = stats["candidate"].queries
+    return {
+        "queries": queries,
+        "seconds": round(seconds, 1),
+        "qps": round(queries / seconds, 1) if seconds else 0.0,
+        "baseline": "replayed" if current is not None else "logged",
+        "current": stats["current"].summary(),
+        "candidate": stats["candidate"].summary(),
+        "compared": compared,
+        "agreement": agreed / compared if compared else 0.0,
+        "new_fallbacks": new_fallbacks,
+        "recovered_fallbacks": recovered,
+        "moved": [
+            {"from": old, "to": new, "queries": count}
+            for (old, new), count in moved.most_common(20)
+        ],
+    }
+
+
+def print_summary(summary):
+    print(
+        f"Replayed {summary['queries']} message(s) in {summary['seconds']}s "
+        f"({summary['qps']}/s); baseline: {summary['baseline']} intents"
+    )
+    current, candidate = summary["current"], summary["candidate"]
+    print(f"{'':16}{'current':>12}{'candidate':>12}{'change':>12}")
+    for field in ("errors", "unknown", "fallback_rate", "mean_confidence"):
+        print(_row(field, current[field], candidate[field]))
+    for field in ("p50_ms", "p95_ms", "p99_ms"):
+        print(_row(field, current[field], candidate[field]))
+    print(
+        f"Same intent for {summary['agreement']:.1%} of {summary['compared']} "
+        f"compared message(s); {summary['new_fallbacks']} newly fall back, "
+        f"{summary['recovered_fallbacks']} no longer do."
+    )
+    if summary["moved"]:
+        print("Most common intent changes:")
+        for move in summary["moved"]:
+            print(f"  {move['queries']:>7}  {move['from']} -> {move['to']}")
+
+
+def _row(field, old, new):
+    def fmt(value):
+        if value is None:
+            return "-"
+        return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+    change = "-" if old is None or new is None else fmt(new - old)
+    return f"{field:16}{fmt(old):>12}{fmt(new):>12}{change:>12}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--candidate", required=True, help="Rasa server URL to test")
+    parser.add_argument(
+        "--current",
+        help="Rasa server URL of the deployed model (default: logged intents)",
+    )
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, help="Oldest log to replay"
+    )
+    parser.add_argument(
+        "--until", type=datetime.fromisoformat, help="Stop before this time"
+    )
+    parser.add_argument("--limit", type=int, help="Replay at most this many messages")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--report", metavar="CSV", help="Write per-query results here")
+    parser.add_argument(
+        "--changes-only",
+        action="store_true",
+        help="Only report messages whose intent changed",
+    )
+    parser.add_argument("--json", metavar="FILE", help="Also save the summary as JSON")
+    args = parser.parse_args()
+
+    candidate = ParseClient(args.candidate, args.workers, args.timeout)
+    current = args.current and ParseClient(args.current, args.workers, args.timeout)
+    report = (
+        open(args.report, "w", newline="", encoding="utf-8") if args.report else None
+    )
+    db.connect(reuse_if_open=True)
+    try:
+        summary = replay(
+            candidate,
+            current,
+            args.since,
+            args.until,
+            args.limit,
+            args.workers,
+            report,
+            args.changes_only,
+        )
+    finally:
+        db.close()
+        if report is not None:
+            report.close()
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
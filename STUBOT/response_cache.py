@@ -0,0 +1,107 @@
+# response_cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(message):
+    """Canonical form of a question: lowercase, no punctuation, single spaces."""
+    message = _PUNCTUATION.sub(" ", message.lower())
+    return _WHITESPACE.sub(" ", message).strip()
+
+
+class ResponseCache:
+    """
+    Answers repeated FAQ questions without a round trip to Rasa.
+
+    Only replies whose text is in `cacheable` (single-turn domain responses,
+    see domain.single_turn_texts) are stored, so greetings, fallbacks and
+    anything that depends on conversation state always go to Rasa.
+    Entries expire after ttl seconds and the least recently used are
+    dropped beyond max_entries. Each keeps the intent and confidence Rasa
+    classified the question as, so cache hits are logged with them too.
+    """
+
+    def __init__(self, cacheable, ttl=3600, max_entries=5000):
+        self.cacheable = set(cacheable)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.model = None  # fingerprint of the Rasa model the entries came from
+        # key -> [expires_at, responses, intent, confidence]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, message):
+        """(responses, intent, confidence) for message, or None on a miss."""
+        key = normalize(message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tuple(entry[1:])
+
+    def put(self, message, responses, intent=None, confidence=None):
+        """Store Rasa's replies for message if every one of them is cacheable."""
+        if not responses or any(r.get("text") not in self.cacheable for r in responses):
+            return False
+        key = normalize(message)
+        if not key:
+            return False
+        with self._lock:
+            self._entries[key] = [
+                time.monotonic() + self.ttl,
+                responses,
+                intent,
+                confidence,
+            ]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def set_intent(self, message, intent, confidence):
+        """Record the intent of a cached question once it is known."""
+        with self._lock:
+            entry = self._entries.get(normalize(message))
+            if entry is not None:
+                entry[2:] = [intent, confidence]
+
+    def invalidate(self):
+        """Drop everything, e.g. after a new Rasa model is loaded."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def check_model(self, fingerprint):
+        """Invalidate if fingerprint differs from the model the cache was filled by."""
+        if fingerprint is None:
+            return
+        with self._lock:
+            changed = self.model is not None and fingerprint != self.model
+            self.model = fingerprint
+        if changed:
+            self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+                "model": self.model,
+            }
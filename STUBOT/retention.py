@@ -0,0 +1,250 @@
+# retention.py
+"""
+Delete chat logs older than a retention period, with their audio.
+
+    python retention.py --days 90 --archive archive --vacuum incremental
+    python retention.py --sweep-only     # just remove orphaned audio
+
+Rows are deleted oldest first in batched transactions, optionally written
+to a gzipped JSONL archive first. Afterwards audio files that no chat log
+refers to are swept, and the database file is vacuumed. The dashboard
+counters keep their history; purged rows are tallied under "purged".
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: passes are only serialized within a process
+    fcntl = None
+
+from peewee import SqliteDatabase
+
+from audio_store import AudioStore, is_sharded
+from model import db, ChatLog, ChartData, EPOCH, upsert_add, write_transaction
+from presynth import MANIFEST_NAME
+from tts_cache import CACHE_PREFIX
+
+AUDIO_FOLDER = "static/audio"
+# Files this young may belong to a chat whose log is still queued
+ORPHAN_GRACE_SECONDS = 3600
+VACUUM_MODES = ("none", "incremental", "full")
+# Every worker process schedules passes; this file lets only one run at once
+LOCK_FILE = os.environ.get(
+    "RETENTION_LOCK_FILE", os.path.join(tempfile.gettempdir(), "stubot-retention.lock")
+)
+
+_running = threading.Lock()
+
+
+@contextmanager
+def exclusive(lock_file=LOCK_FILE):
+    """
+    Hold the retention lock, across processes on this host where fcntl
+    exists. Yields False, without waiting, if another pass holds it.
+    """
+    if not _running.acquire(blocking=False):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        with open(lock_file, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        _running.release()
+
+
+def _archive_batch(path, rows):
+    # Each batch is appended as its own gzip member; readers see one stream
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in rows:
+            row = dict(row, timestamp=row["timestamp"].isoformat())
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _remove_audio(audio_folder, filenames):
+    store = AudioStore(audio_folder)
+    removed = 0
+    for filename in filenames:
+        # Cached TTS files are shared between logs, the cache evicts them
+        if not filename or os.path.basename(filename).startswith(CACHE_PREFIX):
+            continue
+        try:
+            removed += store.delete(filename)
+        except OSError as e:
+            print(f"Error removing audio file {filename}: {e}")
+    return removed
+
+
+def purge(before, audio_folder=AUDIO_FOLDER, archive_folder=None, batch_size=500):
+    """
+    Delete chat logs with timestamp < before, batch_size rows per
+    transaction, and remove their audio files once each batch commits.
+    Returns (rows deleted, audio files removed).
+    """
+    archive = None
+    if archive_folder:
+        os.makedirs(archive_folder, exist_ok=True)
+        stamp = f"{before:%Y%m%d}-{datetime.utcnow():%Y%m%d%H%M%S}"
+        name = f"chatlogs-before-{stamp}.jsonl.gz"
+        archive = os.path.join(archive_folder, name)
+
+    deleted = files = 0
+    while True:
+        with write_transaction():
+            rows = list(
+                ChatLog.select()
+                .where(ChatLog.timestamp < before)
+                .order_by(ChatLog.timestamp, ChatLog.id)
+                .limit(batch_size)
+                .dicts()
+            )
+            if not rows:
+                break
+            if archive:
+                _archive_batch(archive, rows)
+            # Count what this DELETE removed, not what was selected: rows
+            # a concurrent pass got to first must not be counted twice
+            count = (
+                ChatLog.delete()
+                .where(ChatLog.id.in_([r["id"] for r in rows]))
+                .execute()
+            )
+            upsert_add(
+                ChartData,
+                [{"metric_name": "purged", "timestamp": EPOCH, "value": count}],
+                [ChartData.metric_name, ChartData.timestamp],
+                ChartData.value,
+            )
+        deleted += count
+        # Stored (sharded) files may be shared by other logs; the orphan
+        # sweep removes them once nothing refers to them
+        files += _remove_audio(
+            audio_folder,
+            [
+                r[f]
+                for r in rows
+                for f in ("user_audio_filename", "bot_audio_filename")
+                if not is_sharded(r[f])
+            ],
+        )
+    return deleted, files
+
+
+def sweep_orphans(audio_folder=AUDIO_FOLDER, grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Remove audio files no chat log refers to. Returns the number removed."""
+    referenced = set()
+    query = ChatLog.select(ChatLog.user_audio_filename, ChatLog.bot_audio_filename)
+    for user_audio, bot_audio in query.tuples().iterator():
+        referenced.update((user_audio, bot_audio))
+
+    cutoff = time.time() - grace_seconds
+    orphans = [
+        name
+        for name in AudioStore(audio_folder).iter_names()
+        if name not in referenced
+        and name != MANIFEST_NAME
+        and os.path.getmtime(os.path.join(audio_folder, name)) < cutoff
+    ]
+    return _remove_audio(audio_folder, orphans)
+
+
+def vacuum(mode="incremental"):
+    """
+    Give freed pages back to the filesystem (SQLite only). "full" rewrites
+    the file and switches it to incremental auto-vacuum, so later runs can
+    use the cheap "incremental" mode.
+    """
+    if mode == "none" or not isinstance(db, SqliteDatabase):
+        return
+    if mode == "full":
+        db.execute_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute_sql("VACUUM")
+    elif db.execute_sql("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        # Each step frees one page, so drain the cursor
+        db.execute_sql("PRAGMA incremental_vacuum").fetchall()
+    else:
+        print("auto_vacuum is not incremental yet; run once with --vacuum full.")
+        return
+    db.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def run(
+    days,
+    audio_folder=AUDIO_FOLDER,
+    archive_folder=None,
+    batch_size=500,
+    vacuum_mode="incremental",
+):
+    """One retention pass: purge, sweep orphans, vacuum. Skipped if one is running."""
+    with exclusive() as acquired:
+        if not acquired:
+            return None
+        try:
+            db.connect(reuse_if_open=True)
+            before = datetime.utcnow() - timedelta(days=days)
+            deleted, files = purge(before, audio_folder, archive_folder, batch_size)
+            orphans = sweep_orphans(audio_folder)
+            if deleted:
+                vacuum(vacuum_mode)
+            return {
+                "deleted": deleted,
+                "audio_removed": files,
+                "orphans_removed": orphans,
+            }
+        finally:
+            if not db.is_closed():
+                db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=float, help="Keep this many days of logs")
+    parser.add_argument("--audio-folder", default=AUDIO_FOLDER)
+    parser.add_argument("--archive", metavar="FOLDER", help="Archive purged rows here")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", choices=VACUUM_MODES, default="incremental")
+    parser.add_argument("--sweep-only", action="store_true")
+    parser.add_argument("--grace-seconds", type=int, default=ORPHAN_GRACE_SECONDS)
+    args = parser.parse_args()
+
+    with exclusive() as acquired:
+        if not acquired:
+            sys.exit("Another retention pass is running.")
+        db.connect(reuse_if_open=True)
+        if args.sweep_only:
+            print(
+                f"Removed {sweep_orphans(args.audio_folder, args.grace_seconds)} orphaned audio file(s)."
+            )
+        elif args.days is None:
+            parser.error("--days is required unless --sweep-only is given")
+        else:
+            before = datetime.utcnow() - timedelta(days=args.days)
+            deleted, files = purge(
+                before, args.audio_folder, args.archive, args.batch_size
+            )
+            orphans = sweep_orphans(args.audio_folder, args.grace_seconds)
+            vacuum(args.vacuum)
+            print(
+                f"Deleted {deleted} chat log(s) and {files} audio file(s); "
+                f"removed {orphans} orphaned audio file(s)."
+            )
@@ -0,0 +1,86 @@
+# search.py
+from markupsafe import Markup, escape
+from peewee import OperationalError
+
+from model import ChatLog, ChatLogIndex
+
+# highlight()/snippet() wrap matches in these, and the text is escaped
+# before they become <mark> tags, so logged messages can't inject HTML
+_START, _END = "\x02", "\x03"
+# bm25 column weights: a hit in what the user asked counts more
+WEIGHTS = (2.0, 1.0)
+
+
+class SearchError(Exception):
+    """The search text could not be turned into a valid FTS5 query."""
+
+
+def to_html(text):
+    return Markup(str(escape(text)).replace(_START, "<mark>").replace(_END, "</mark>"))
+
+
+def encode_rank_cursor(log):
+    return f"{log.score!r}_{log.id}"
+
+
+def decode_rank_cursor(cursor):
+    """Parse a "<bm25 score>_<id>" cursor; None if it is malformed."""
+    try:
+        score, log_id = cursor.rsplit("_", 1)
+        return float(score), int(log_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search_logs(text, limit, before=None, after=None):
+    """
+    Chat logs matching text, best match first (bm25), with highlighted
+    user_message_html / bot_response_html attributes.
+
+    Keyset-paginated on (score, id): `before` continues to worse matches
+    and `after` goes back to better ones. Returns (logs, more) where more
+    says whether another page exists in that direction.
+    """
+    try:
+        expression = ChatLogIndex.web_query(text)
+    except Exception:
+        expression = ChatLogIndex.clean_query(text)
+    if not expression or not expression.strip():
+        return [], False
+
+    score = ChatLogIndex.bm25(*WEIGHTS)
+    query = (
+        ChatLog.select(
+            ChatLog,
+            score.alias("score"),
+            ChatLogIndex.user_message.highlight(_START, _END).alias("user_message_hl"),
+            ChatLogIndex.bot_response.snippet(_START, _END, "...", 24).alias(
+                "bot_response_hl"
+            ),
+        )
+        .join(ChatLogIndex, on=(ChatLogIndex.rowid == ChatLog.id))
+        .where(ChatLogIndex.match(expression))
+    )
+    # bm25 is lower for better matches
+    if after:
+        s, log_id = after
+        query = query.where((score < s) | ((score == s) & (ChatLog.id < log_id)))
+        query = query.order_by(score.desc(), ChatLog.id.desc())
+    else:
+        if before:
+            s, log_id = before
+            query = query.where((score > s) | ((score == s) & (ChatLog.id > log_id)))
+        query = query.order_by(score, ChatLog.id)
+
+    try:
+        logs = list(query.limit(limit + 1))
+    except OperationalError as e:
+        raise SearchError(str(e))
+    more = len(logs) > limit
+    logs = logs[:limit]
+    if after:
+        logs.reverse()
+    for log in logs:
+        log.user_message_html = to_html(log.user_message_hl)
+        log.bot_response_html = to_html(log.bot_response_hl)
+    return logs, more
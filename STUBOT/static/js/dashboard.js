@@ -1,120 +1,94 @@
-// document.addEventListener('DOMContentLoaded', () => {
-//   const contentArea = document.getElementById('contentArea');
-
-  // Default view
-  // contentArea.innerHTML = '<p>This is the home dashboard showing all data. (Static for now)</p>';
-
-  // Navigation Handlers
-  // document.getElementById('home').addEventListener('click', (e) => {
-  //   e.preventDefault();
-  //   contentArea.innerHTML = '<p>This is the home dashboard showing all data.</p>';
-  // });
-
-  // document.getElementById('logs').addEventListener('click', (e) => {
-  //   e.preventDefault();
-  //   contentArea.innerHTML = '<p>Here you will see logs of all questions asked by users.</p>';
-  // });
+// Charts are drawn from the server's pre-aggregated analytics endpoints,
+// so the page loads the same few KB however many chats are logged.
+const charts = {};
+
+function getJSON(url) {
+  return fetch(url, { credentials: 'same-origin' }).then(res => {
+    if (!res.ok) throw new Error(`${url}: ${res.status}`);
+    return res.json();
+  });
+}
 
-  // document.getElementById('logout').addEventListener('click', (e) => {
-  //   e.preventDefault();
-  //   alert('Logging out...');
-  //   window.location.href = 'admin-login.html'; // Or login page
-//   });
-// });
+function drawChart(id, config) {
+  if (charts[id]) charts[id].destroy();
+  charts[id] = new Chart(document.getElementById(id).getContext('2d'), config);
+}
 
+// Buckets are UTC: hours are shown in local time, days as the UTC day they cover
+function bucketLabel(iso, bucket) {
+  const d = new Date(iso);
+  return bucket === 'hour'
+    ? d.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
+    : d.toLocaleDateString([], { month: 'short', day: 'numeric', timeZone: 'UTC' });
+}
 
-const contentArea = document.getElementById('contentArea');
+function loadSeries(bucket) {
+  getJSON(`/api/analytics/queries?bucket=${bucket}`).then(data => {
+    drawChart('lineChart', {
+      type: 'line',
+      data: {
+        labels: data.series.map(p => bucketLabel(p.bucket, bucket)),
+        datasets: [
+          { label: 'Answered', data: data.series.map(p => p.answered), borderColor: '#198754', fill: false },
+          { label: 'Unanswered', data: data.series.map(p => p.unanswered), borderColor: '#dc3545', fill: false }
+        ]
+      },
+      options: { responsive: true, scales: { y: { beginAtZero: true } } }
+    });
+  });
 
-// Chart data
-let totalCount = 0;
-let answeredCount = 0;
-let unansweredCount = 0;
+  getJSON(`/api/analytics/answer-rate?bucket=${bucket}`).then(data => {
+    drawChart('rateChart', {
+      type: 'line',
+      data: {
+        labels: data.series.map(p => bucketLabel(p.bucket, bucket)),
+        datasets: [{
+          label: 'Answer rate (%)',
+          data: data.series.map(p => p.answer_rate === null ? null : Math.round(p.answer_rate * 100)),
+          borderColor: '#0d6efd',
+          spanGaps: true,
+          fill: false
+        }]
+      },
+      options: { responsive: true, scales: { y: { beginAtZero: true, max: 100 } } }
+    });
+  });
+}
 
-// Load charts and counts on home
 function loadHome() {
-  fetch('logs.json')
-    .then(res => res.json())
-    .then(data => {
-      totalCount = data.length;
-      answeredCount = data.filter(q => q.status === 'answered').length;
-      unansweredCount = totalCount - answeredCount;
-
-      document.getElementById('total').textContent = totalCount;
-      document.getElementById('answered').textContent = answeredCount;
-      document.getElementById('unanswered').textContent = unansweredCount;
-
-      // Line Chart
-      const ctxLine = document.getElementById('lineChart').getContext('2d');
-      new Chart(ctxLine, {
-        type: 'line',
-        data: {
-          labels: data.map((_, i) => `Q${i + 1}`),
-          datasets: [
-            {
-              label: 'Answered',
-              data: data.map(q => q.status === 'answered' ? 1 : 0),
-              borderColor: '#198754',
-              fill: false
-            },
-            {
-              label: 'Unanswered',
-              data: data.map(q => q.status === 'unanswered' ? 1 : 0),
-              borderColor: '#dc3545',
-              fill: false
-            }
-          ]
-        },
-        options: {
-          responsive: true,
-          scales: {
-            y: { beginAtZero: true }
-          }
-        }
-      });
-
-      // Pie Chart
-      const ctxPie = document.getElementById('pieChart').getContext('2d');
-      new Chart(ctxPie, {
-        type: 'pie',
-        data: {
-          labels: ['Answered', 'Unanswered'],
-          datasets: [{
-            data: [answeredCount, unansweredCount],
-            backgroundColor: ['#198754', '#dc3545']
-          }]
-        }
-      });
+  const bucket = document.getElementById('bucket').value;
+  loadSeries(bucket);
+
+  getJSON('/api/analytics/top-intents?limit=8').then(data => {
+    drawChart('pieChart', {
+      type: 'pie',
+      data: {
+        labels: data.intents.map(i => i.intent),
+        datasets: [{ data: data.intents.map(i => i.count) }]
+      }
+    });
+  });
 
-      // Calendar
-      const calendarEl = document.getElementById('calendar');
-      new FullCalendar.Calendar(calendarEl, {
-        initialView: 'dayGridMonth',
-        height: 300,
-        events: data.map(q => ({
-          title: q.status,
-          start: q.timestamp
-        }))
-      }).render();
+  getJSON('/api/analytics/top-unanswered?limit=10').then(data => {
+    const list = document.getElementById('unansweredList');
+    list.innerHTML = '';
+    data.questions.forEach(q => {
+      const item = document.createElement('li');
+      item.textContent = `${q.question} (${q.count})`;
+      list.appendChild(item);
     });
+  });
 }
 
-// Navigation
 window.addEventListener('DOMContentLoaded', () => {
   loadHome();
 
-  document.getElementById('home').addEventListener('click', e => {
-    e.preventDefault();
-    loadHome();
-  });
-
-  document.getElementById('logs').addEventListener('click', e => {
-    e.preventDefault();
-    contentArea.innerHTML = '<p>Logs section coming soon...</p>';
+  document.getElementById('bucket').addEventListener('change', e => {
+    loadSeries(e.target.value);
   });
 
-  document.getElementById('logout').addEventListener('click', e => {
+  document.getElementById('home').addEventListener('click', e => {
     e.preventDefault();
-    alert('Logging out...');
-    window.location.href = 'admin-login.html';
+    loadHome();
   });
 });
@@ -9,6 +9,7 @@ let isProcessing = false;
 let currentAudio = null;
 let silenceTimer = null;
 let recordingTimeout = null;
+let replySeq = 0; // Incremented per reply so stale background audio is not played
 
 // Initialize the application when the DOM is fully loaded
 document.addEventListener('DOMContentLoaded', function() {
@@ -113,10 +114,8 @@ async function handleSendMessage() {
 
         appendMessage('bot', botResponseText); // Display text response
 
-        // Play bot audio response
-        if (botAudioUrl) {
-            playAudio(botAudioUrl);
-        }
+        // Play bot audio response (it may still be rendering in the background)
+        playBotAudio(botAudioUrl, data.bot_audio_job);
 
     } catch (error) {
         console.error('Error sending message to backend:', error);
@@ -214,6 +213,47 @@ function playAudio(url) {
     });
 }
 
+/**
+ * Play the bot's audio, polling for it first if the server is still
+ * synthesizing it in the background.
+ */
+async function playBotAudio(botAudioUrl, botAudioJob) {
+    const seq = ++replySeq;
+
+    if (!botAudioUrl && botAudioJob) {
+        botAudioUrl = await waitForBotAudio(botAudioJob);
+    }
+
+    // Skip audio for a reply the user has already moved past
+    if (botAudioUrl && seq === replySeq) {
+        playAudio(botAudioUrl).catch(() => {});
+    }
+}
+
+/**
+ * Poll /chat/audio/<job> until the audio is ready (returns null on failure/timeout)
+ */
+async function waitForBotAudio(jobId, timeoutMs = 15000) {
+    const deadline = Date.now() + timeoutMs;
+    let delay = 200;
+
+    while (Date.now() < deadline) {
+        try {
+            const response = await fetch(`/chat/audio/${jobId}`);
+            if (response.status !== 202) {
+                const data = await response.json();
+                return data.status === 'ready' ? data.bot_audio_url : null;
+            }
+        } catch (error) {
+            console.error('Error polling for bot audio:', error);
+            return null;
+        }
+        await new Promise(resolve => setTimeout(resolve, delay));
+        delay = Math.min(delay * 1.5, 1000);
+    }
+    return null;
+}
+
 /**
  * Stop any currently playing audio
  */
@@ -292,7 +332,8 @@ async function startVoiceRecording() {
         
         // Initialize MediaRecorder
         mediaRecorder = new MediaRecorder(stream, {
-            mimeType: 'audio/webm;codecs=opus'
+            mimeType: 'audio/webm;codecs=opus',
+            audioBitsPerSecond: 32000 // speech; keeps uploads small
         });
         audioChunks = [];
 
@@ -502,9 +543,8 @@ async function sendMessageWithVoice(message, audioBlob) {
         formData.append('userId', getOrCreateUserId());
         
         if (audioBlob && audioBlob.size > 0) {
-            // Convert webm to wav for better compatibility
-            const wavBlob = await convertWebmToWav(audioBlob);
-            formData.append('voice_audio', wavBlob, 'user_voice.wav');
+            // Sent as recorded (WebM/Opus); the server transcodes it for storage
+            formData.append('voice_audio', audioBlob, 'user_voice.webm');
         }
 
         // Send to backend
@@ -529,9 +569,7 @@ async function sendMessageWithVoice(message, audioBlob) {
             await playAudio(userAudioUrl);
         }
         
-        if (botAudioUrl) {
-            playAudio(botAudioUrl);
-        }
+        playBotAudio(botAudioUrl, data.bot_audio_job);
 
     } catch (error) {
         console.error('Error sending voice message:', error);
@@ -543,20 +581,6 @@ async function sendMessageWithVoice(message, audioBlob) {
     }
 }
 
-/**
- * Convert WebM blob to WAV blob for better compatibility
- */
-async function convertWebmToWav(webmBlob) {
-    try {
-        // For simplicity, we'll return the original blob
-        // In a production environment, you might want to use a proper conversion library
-        return webmBlob;
-    } catch (error) {
-        console.error('Error converting WebM to WAV:', error);
-        return webmBlob;
-    }
-}
-
 /**
  * Update voice button visual state
  */
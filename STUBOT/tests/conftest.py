@@ -0,0 +1,89 @@
+# tests/conftest.py
+"""
+Shared fixtures. Run the suite from STUBOT/:
+
+    python -m pytest tests
+
+Tests using `database` run once on SQLite and once on MariaDB at
+TEST_MARIADB_URL (pymysql needed); the MariaDB run is skipped when no
+server can be reached there.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+STUBOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, STUBOT)
+os.chdir(STUBOT)  # app.py loads domain.yml and static/ relative to here
+
+# model.py binds its database at import: keep it away from chatbot_logs.db
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="stubot-tests-"), "chatbot_logs.db"
+)
+os.environ.setdefault("RASA_SERVER_URL", "http://127.0.0.1:9/webhooks/rest/webhook")
+
+import model  # noqa: E402
+
+MODELS = [model.User, model.ChatLog, model.ChartData, model.UnansweredQuestion]
+MARIADB_URL = os.environ.get(
+    "TEST_MARIADB_URL",
+    "mysql+pool://root@127.0.0.1:3306/stubot_test?max_connections=4&stale_timeout=60",
+)
+
+
+def open_database(request, url, monkeypatch):
+    """
+    Connect to url and make it the database of model.py and every module
+    that imported its `db`, with empty tables. Skips if MariaDB is down.
+    """
+    database = model.make_database(url)
+    try:
+        database.connect()
+    except Exception as e:
+        if url.startswith("sqlite"):
+            raise
+        pytest.skip(f"no MariaDB at {url}: {e}")
+    for name in ("model", "migrate", "retention", "replay", "app"):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, "db"):
+            monkeypatch.setattr(module, "db", database)
+    request.addfinalizer(database.close)
+    return database
+
+
+def empty_tables(database):
+    database.drop_tables(MODELS, safe=True)
+    database.create_tables(MODELS)
+
+
+@pytest.fixture(params=["sqlite", "mariadb"])
+def database(request, tmp_path, monkeypatch):
+    """An empty log store on each backend (DATABASE_URL values)."""
+    url = f"sqlite:///{tmp_path / 'logs.db'}"
+    if request.param == "mariadb":
+        url = MARIADB_URL
+    database = open_database(request, url, monkeypatch)
+    with database.bind_ctx(MODELS):
+        empty_tables(database)
+        yield database
+        database.drop_tables(MODELS, safe=True)
+
+
+@pytest.fixture(params=["sqlite", "mariadb"])
+def pooled_database(request, tmp_path, monkeypatch):
+    """Like `database`, through a connection pool on both backends."""
+    # Pooled connections move between threads (requests, the log writer)
+    url = f"sqlite+pool:///{tmp_path / 'logs.db'}?max_connections=2"
+    url += "&check_same_thread=false"
+    if request.param == "mariadb":
+        url = MARIADB_URL
+    database = open_database(request, url, monkeypatch)
+    with database.bind_ctx(MODELS):
+        empty_tables(database)
+        database.close()  # back to the pool, like after initialize_db()
+        yield database
+        with database.connection_context():
+            database.drop_tables(MODELS, safe=True)
@@ -0,0 +1,52 @@
+# tests/test_app.py
+from datetime import datetime
+
+import app as stubot
+from log_writer import LogWriter
+
+
+def test_requests_hand_pooled_connections_back(pooled_database):
+    client = stubot.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+
+    for _ in range(5):
+        assert client.get("/admin/chatlogs").status_code == 200
+        assert pooled_database.is_closed()
+
+    # Every request reused the one pooled connection
+    assert not pooled_database._in_use
+    assert len(pooled_database._connections) == 1
+
+
+def test_metrics_and_static_files_take_no_connection(pooled_database, monkeypatch):
+    connects = []
+    connect = pooled_database.connect
+    monkeypatch.setattr(
+        pooled_database, "connect", lambda **kw: connects.append(kw) or connect(**kw)
+    )
+    client = stubot.app.test_client()
+
+    client.get("/metrics")
+    client.get("/static/js/dashboard.js")
+
+    assert connects == []
+
+
+def test_log_writer_hands_pooled_connections_back(pooled_database):
+    writer = LogWriter(stubot.write_chat_logs, flush_interval=0.01)
+    for i in range(3):
+        writer.enqueue(
+            {
+                "user_id": "student",
+                "user_message": f"question {i}",
+                "bot_response": "An answer.",
+                "timestamp": datetime(2025, 3, 4, 9),
+                "status": "answered",
+            }
+        )
+    writer.close()
+
+    assert writer.stats()["written"] == 3
+    # Nothing held between batches for MariaDB's wait_timeout to kill
+    assert not pooled_database._in_use
@@ -0,0 +1,136 @@
+# tests/test_counters.py
+from datetime import datetime
+from types import SimpleNamespace
+
+from peewee import MySQLDatabase
+
+import model
+from model import (
+    EPOCH,
+    ChartData,
+    UnansweredQuestion,
+    bump_counters,
+    get_counters,
+    record_chats,
+    upsert_add,
+)
+
+DAY = datetime(2025, 3, 4)
+
+
+def make_log(message, status, hour=9, intent=None, bot_response="An answer."):
+    return {
+        "user_id": "student",
+        "user_message": message,
+        "bot_response": bot_response,
+        "user_audio_filename": None,
+        "bot_audio_filename": None,
+        "timestamp": DAY.replace(hour=hour, minute=15),
+        "status": status,
+        "intent": intent,
+        "confidence": 0.9 if intent else None,
+    }
+
+
+LOGS = [
+    make_log("Where is the library?", "answered", intent="library"),
+    make_log("where is the library", "answered", hour=10, intent="library"),
+    make_log("Where is the clinic?", "answered_locally", intent="health_service"),
+    make_log("what is the weather like", "fallback", intent="nlu_fallback"),
+    make_log("What is the weather like?", "rasa_unavailable", hour=10),
+    make_log("hello", "error"),
+]
+
+
+def counter(name, bucket=EPOCH):
+    row = ChartData.get_or_none(
+        ChartData.metric_name == name, ChartData.timestamp == bucket
+    )
+    return row.value if row else 0
+
+
+def test_record_chats_updates_counters(database):
+    record_chats(LOGS)
+
+    assert model.ChatLog.select().count() == len(LOGS)
+    assert get_counters() == {
+        "total": 6,
+        "answered": 3,
+        "unanswered": 3,
+        "purged": 0,
+    }
+    assert counter("queries_day", DAY) == 6
+    assert counter("answered_hour", DAY.replace(hour=9)) == 2
+    assert counter("unanswered_hour", DAY.replace(hour=10)) == 1
+    assert counter("intent:library") == 2
+    assert counter("intent_day:health_service", DAY) == 1
+
+
+def test_unanswered_questions_group_by_normalized_text(database):
+    record_chats(LOGS)
+
+    rows = {q.question: q for q in UnansweredQuestion.select()}
+    assert set(rows) == {"what is the weather like", "hello"}
+    assert rows["what is the weather like"].count == 2
+    assert rows["what is the weather like"].last_seen == DAY.replace(hour=10, minute=15)
+
+
+def test_counters_accumulate_across_batches(database):
+    record_chats(LOGS[:3])
+    record_chats(LOGS[3:])
+    record_chats(LOGS[:1])
+
+    assert get_counters()["total"] == 7
+    assert counter("intent:library") == 3
+
+
+def test_bump_counters_removes_logs(database):
+    record_chats(LOGS)
+    bump_counters(LOGS[3:], sign=-1)
+
+    assert get_counters() == {
+        "total": 3,
+        "answered": 3,
+        "unanswered": 0,
+        "purged": 0,
+    }
+    assert all(q.count == 0 for q in UnansweredQuestion.select())
+
+
+def test_rows_without_status_are_counted_from_the_response(database):
+    legacy = make_log(
+        "Is the bot up?",
+        None,
+        bot_response=model.RASA_UNAVAILABLE_PREFIX + ". Please try again later.",
+    )
+    record_chats([legacy, make_log("Where is the library?", None)])
+
+    assert get_counters()["answered"] == 1
+    assert get_counters()["unanswered"] == 1
+
+
+def test_mysql_upsert_uses_on_duplicate_key(monkeypatch):
+    # Rendered without a server: the SQL is what MariaDB would receive
+    database = MySQLDatabase("stubot")
+    executed = []
+
+    def execute_sql(sql, params=None, *args, **kwargs):
+        executed.append(sql)
+        return SimpleNamespace(lastrowid=1, rowcount=1)
+
+    monkeypatch.setattr(database, "execute_sql", execute_sql)
+    monkeypatch.setattr(model, "db", database)
+    with database.bind_ctx([ChartData]):
+        upsert_add(
+            ChartData,
+            [{"metric_name": "total", "timestamp": EPOCH, "value": 1}],
+            [ChartData.metric_name, ChartData.timestamp],
+            ChartData.value,
+            replace=[ChartData.timestamp],
+        )
+
+    (sql,) = executed
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "`value` = (`value` + VALUES(`value`))" in sql
+    assert "`timestamp` = VALUES(`timestamp`)" in sql
+    assert "ON CONFLICT" not in sql
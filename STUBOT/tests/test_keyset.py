@@ -0,0 +1,115 @@
+# tests/test_keyset.py
+import json
+import re
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+
+import pytest
+
+import app as stubot
+from export import iter_logs
+from model import ChatLog, record_chats
+
+START = datetime(2025, 3, 4, 9)
+
+
+@pytest.fixture
+def logs(database):
+    """25 logs, three to a timestamp, so pages split ties on id."""
+    record_chats(
+        [
+            {
+                "user_id": "student",
+                "user_message": f"question {i:02d}",
+                "bot_response": "An answer.",
+                "timestamp": START + timedelta(seconds=i // 3),
+                "status": "answered",
+            }
+            for i in range(25)
+        ]
+    )
+    return list(
+        ChatLog.select(ChatLog.id, ChatLog.timestamp)
+        .order_by(ChatLog.timestamp, ChatLog.id)
+        .tuples()
+    )
+
+
+def test_iter_logs_reads_every_row_once_in_order(logs):
+    rows = list(iter_logs(batch_size=4))
+
+    assert [(r["id"], r["timestamp"]) for r in rows] == logs
+
+
+def test_iter_logs_resumes_after_a_cursor(logs):
+    log_id, ts = logs[9]
+
+    rows = list(iter_logs(after=(ts, log_id), batch_size=4))
+
+    assert [r["id"] for r in rows] == [log_id for log_id, _ in logs[10:]]
+
+
+def test_iter_logs_between_start_and_end(logs):
+    start, end = START + timedelta(seconds=2), START + timedelta(seconds=5)
+
+    rows = list(iter_logs(start, end, after=(start, logs[6][0]), batch_size=2))
+
+    # Ties at `start` after the cursor, then everything up to `end`
+    assert [r["id"] for r in rows] == [log_id for log_id, _ in logs[7:15]]
+
+
+def chat_log_page(client, **cursor):
+    html = client.get("/admin/chatlogs", query_string=cursor).get_data(as_text=True)
+    messages = re.findall(r'title="(question \d\d)"', html)
+    next_cursor = re.search(r'before=([^&"]+)', html)
+    prev_cursor = re.search(r'after=([^&"]+)', html)
+    return (
+        messages,
+        next_cursor and unquote(next_cursor.group(1)),
+        prev_cursor and unquote(prev_cursor.group(1)),
+    )
+
+
+def test_chat_log_pages_walk_back_and_forth(logs):
+    client = stubot.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+
+    pages, cursor = [], None
+    while True:
+        messages, next_cursor, prev_cursor = chat_log_page(
+            client, **({"before": cursor} if cursor else {})
+        )
+        pages.append((messages, prev_cursor))
+        if len(pages) == 3:
+            break
+        cursor = next_cursor
+
+    seen = [message for messages, _ in pages for message in messages]
+    assert seen == [f"question {i:02d}" for i in range(24, -1, -1)]
+    # `after` from the second page leads back to the first
+    messages, _, _ = chat_log_page(client, after=pages[1][1])
+    assert messages == pages[0][0]
+
+
+def test_export_converts_offsets_to_utc(logs):
+    client = stubot.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+
+    # 11:00+02:00 is START + 2s in UTC; compared with the naive cursor
+    # mid-stream, an aware start would cut the file off after the headers
+    response = client.get(
+        "/admin/chatlogs/export",
+        query_string={
+            "format": "jsonl",
+            "start": "2025-03-04T11:00:02+02:00",
+            "end": "2025-03-04T09:00:05+00:00",
+            "after": f"{START.isoformat()}_{logs[0][0]}",
+        },
+    )
+
+    rows = [
+        json.loads(line) for line in response.get_data(as_text=True).split("\n") if line
+    ]
+    assert [r["id"] for r in rows] == [log_id for log_id, _ in logs[6:15]]
@@ -0,0 +1,78 @@
+# tests/test_migrate.py
+from datetime import datetime
+
+from peewee import CharField, DateTimeField, Model, TextField
+
+import migrate
+from model import STATUS_ANSWERED, STATUS_FALLBACK, STATUS_RASA_UNAVAILABLE, ChatLog
+
+
+class FirstChatLog(Model):
+    """ChatLog as first released, before any of migrate.CHATLOG_COLUMNS."""
+
+    user_id = CharField()
+    user_message = TextField()
+    bot_response = TextField()
+    user_audio_filename = CharField(null=True)
+    bot_audio_filename = CharField(null=True)
+    timestamp = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = ChatLog._meta.table_name
+
+
+def first_release_table(database, responses):
+    database.drop_tables([ChatLog])
+    with database.bind_ctx([FirstChatLog]):
+        database.create_tables([FirstChatLog])
+        for response in responses:
+            FirstChatLog.create(
+                user_id="student", user_message="hi", bot_response=response
+            )
+
+
+def test_apply_schema_adds_columns_and_indexes(database, capsys):
+    first_release_table(database, ["An answer."])
+
+    migrate.apply_schema()
+
+    table = ChatLog._meta.table_name
+    columns = {c.name for c in database.get_columns(table)}
+    assert set(migrate.CHATLOG_COLUMNS) <= columns
+    indexes = {i.name for i in database.get_indexes(table)}
+    assert {f"{table}_status", f"{table}_timestamp_id"} <= indexes
+    assert "schema change(s)" in capsys.readouterr().out
+    # Existing rows survive, with the new columns empty
+    log = ChatLog.get()
+    assert (log.bot_response, log.status, log.intent) == ("An answer.", None, None)
+
+
+def test_apply_schema_leaves_current_schema_alone(database, capsys):
+    migrate.apply_schema()  # tables fresh from create_tables()
+    assert capsys.readouterr().out == ""
+
+    first_release_table(database, [])
+    migrate.apply_schema()
+    capsys.readouterr()
+    migrate.apply_schema()  # and once migrated
+    assert capsys.readouterr().out == ""
+
+
+def test_backfill_status(database):
+    first_release_table(
+        database,
+        [
+            "An answer.",
+            "Sorry, I didn't get that.",
+            "Sorry, the chatbot service is currently unavailable. Try later.",
+        ],
+    )
+    migrate.apply_schema()
+
+    count = migrate.backfill_status(
+        batch_size=2, fallback_texts={"Sorry, I didn't get that."}
+    )
+
+    assert count == 3
+    statuses = [log.status for log in ChatLog.select().order_by(ChatLog.id)]
+    assert statuses == [STATUS_ANSWERED, STATUS_FALLBACK, STATUS_RASA_UNAVAILABLE]
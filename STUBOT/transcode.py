@@ -0,0 +1,137 @@
+# transcode.py
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+from collections import Counter, OrderedDict
+
+FFMPEG = os.environ.get("FFMPEG_BIN", "ffmpeg")
+# Mono 16 kHz Opus in Ogg: plenty for speech at a fraction of the upload size
+SAMPLE_RATE = 16000
+BITRATE = "16k"
+TIMEOUT_SECONDS = 60
+
+_TIME = re.compile(r"time=(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+# Identical uploads share one stored name, so several compress_voice()
+# calls can work on the same raw file. It is only deleted by the last of
+# them; later calls find its transcode in _converted.
+_lock = threading.Lock()
+_in_flight = Counter()  # raw name -> compress_voice() calls using it
+_converted = OrderedDict()  # raw name -> (transcoded name, duration)
+MAX_CONVERTED = 1000
+
+
+def ffmpeg_available():
+    return shutil.which(FFMPEG) is not None
+
+
+def to_opus(src, dst, sample_rate=SAMPLE_RATE, bitrate=BITRATE):
+    """
+    Transcode any audio ffmpeg can read to Ogg/Opus at dst.
+    Returns the duration in seconds (None if ffmpeg didn't report it).
+    Raises CalledProcessError or TimeoutExpired on failure.
+    """
+    result = subprocess.run(
+        [
+            FFMPEG,
+            "-nostdin",
+            "-hide_banner",
+            "-y",
+            "-i",
+            src,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "-c:a",
+            "libopus",
+            "-b:a",
+            bitrate,
+            "-application",
+            "voip",
+            "-f",
+            "ogg",
+            dst,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=TIMEOUT_SECONDS,
+        check=True,
+    )
+    # The last progress line has the output time, even when the input
+    # (e.g. a MediaRecorder webm) carries no duration header
+    times = _TIME.findall(result.stderr)
+    if not times:
+        return None
+    h, m, s = times[-1]
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def wav_duration(path):
+    """Duration of a PCM WAV file, or None if it isn't one."""
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / float(f.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def compress_voice(store, name):
+    """
+    Replace the stored upload `name` with an Opus transcode.
+    Returns (stored name, duration seconds, size bytes); if ffmpeg is
+    missing or fails, the original upload is kept. If the upload is gone,
+    it is (None, None, None).
+    """
+    with _lock:
+        _in_flight[name] += 1
+    try:
+        return _compress_voice(store, name)
+    finally:
+        with _lock:
+            _in_flight[name] -= 1
+            if not _in_flight[name]:
+                del _in_flight[name]
+
+
+def _compress_voice(store, name):
+    src = store.path(name)
+    if not src or not os.path.isfile(src):
+        # An identical upload was converted (and the raw file deleted) first
+        with _lock:
+            converted = _converted.get(name)
+        if converted and store.exists(converted[0]):
+            compact, duration = converted
+            return compact, duration, os.path.getsize(store.path(compact))
+        print(f"Voice upload {name} is missing: logging the chat without it")
+        return None, None, None
+    duration = None
+    if ffmpeg_available():
+        fd, tmp = tempfile.mkstemp(suffix=".opus.tmp", dir=os.path.dirname(src))
+        os.close(fd)
+        try:
+            duration = to_opus(src, tmp)
+            compact = store.save_file(tmp, ".ogg")
+            with _lock:
+                _converted[name] = (compact, duration)
+                _converted.move_to_end(name)
+                while len(_converted) > MAX_CONVERTED:
+                    _converted.popitem(last=False)
+                # Identical uploads transcode identically, so the raw file
+                # can go once no other call is still reading it
+                if compact != name and _in_flight[name] == 1:
+                    store.delete(name)
+            name, src = compact, store.path(compact)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            print(f"Error transcoding voice upload {name}: {e}")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    if duration is None:
+        duration = wav_duration(src)
+    return name, duration, os.path.getsize(src)
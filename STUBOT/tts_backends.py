@@ -0,0 +1,131 @@
+# tts_backends.py
+"""
+Speech synthesizers the TTS cache can render with, chosen by TTS_BACKEND:
+
+    gtts    Google Text-to-Speech (network; the default)
+    espeak  espeak-ng on this machine (offline)
+
+A backend has a `name`, which is part of every cache key so audio from
+different engines never collides, the file `extension` it writes, and
+synthesize(text, path, lang, tld, slow). The espeak backend runs its
+renders in a process pool, so several replies are synthesized at once on
+separate cores while the calling thread just waits for its file.
+"""
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from transcode import ffmpeg_available, to_opus
+
+ESPEAK = os.environ.get("ESPEAK_BIN", "espeak-ng")
+TIMEOUT_SECONDS = 30
+
+
+class GTTSBackend:
+    name = "gtts"
+    extension = ".mp3"
+
+    def synthesize(self, text, path, lang="en", tld="com", slow=False):
+        """Render text to an mp3 file at path using gTTS."""
+        from gtts import gTTS  # Google Text-to-Speech library
+
+        gTTS(text=text, lang=lang, slow=slow, tld=tld).save(path)
+
+    def close(self):
+        pass
+
+
+def espeak_render(binary, voice, speed, text, path, encode):
+    """
+    Render text with espeak-ng to a WAV at path, or to Ogg/Opus if encode.
+    Runs in a worker process of EspeakBackend's pool.
+    """
+    if not encode:
+        _espeak(binary, voice, speed, text, path)
+        return
+    fd, wav_path = tempfile.mkstemp(suffix=".wav", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        _espeak(binary, voice, speed, text, wav_path)
+        to_opus(wav_path, path)
+    finally:
+        os.remove(wav_path)
+
+
+def _espeak(binary, voice, speed, text, wav_path):
+    subprocess.run(
+        [binary, "-v", voice, "-s", str(speed), "-w", wav_path, "--stdin"],
+        input=text,
+        capture_output=True,
+        text=True,
+        timeout=TIMEOUT_SECONDS,
+        check=True,
+    )
+
+
+def _worker_context():
+    """
+    Not fork: by the first render the app has started threads, and a child
+    forked from them can deadlock on a lock one of them held. The fork
+    server only preloads this module, not the (threaded) __main__.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class EspeakBackend:
+    """
+    Offline synthesis with espeak-ng. Output is transcoded to Opus when
+    ffmpeg is available (a few KB per reply) and left as WAV otherwise.
+    `voice` overrides the espeak voice, which is the language by default.
+    """
+
+    name = "espeak"
+
+    def __init__(self, workers=None, voice=None, binary=ESPEAK, speed=160):
+        self.binary = binary
+        self.voice = voice
+        self.speed = speed
+        self.encode = ffmpeg_available()
+        self.extension = ".ogg" if self.encode else ".wav"
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(), mp_context=_worker_context()
+        )
+
+    def available(self):
+        return shutil.which(self.binary) is not None
+
+    def synthesize(self, text, path, lang="en", tld="com", slow=False):
+        """Render text to path in the pool; tld has no espeak equivalent."""
+        future = self.pool.submit(
+            espeak_render,
+            self.binary,
+            self.voice or lang,
+            self.speed * 3 // 4 if slow else self.speed,
+            text,
+            path,
+            self.encode,
+        )
+        future.result(timeout=2 * TIMEOUT_SECONDS)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def make_backend(name, workers=None, voice=None):
+    """The backend called name; raises ValueError for an unknown one."""
+    if name == "gtts":
+        return GTTSBackend()
+    if name == "espeak":
+        backend = EspeakBackend(workers=workers, voice=voice)
+        if not backend.available():
+            print(f"{backend.binary} not found: bot replies will have no audio.")
+        return backend
+    raise ValueError(f"Unknown TTS backend {name!r} (expected gtts or espeak)")
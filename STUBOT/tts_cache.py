@@ -0,0 +1,178 @@
+# tts_cache.py
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from audio_store import shard
+from tts_backends import GTTSBackend
+
+CACHE_PREFIX = "tts_"
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized speech.
+
+    Files are named after a hash of (text, lang, tld, slow, backend) so the
+    same sentence is only ever synthesized once per engine, and sharded by
+    that hash like the rest of the audio store. The cache is kept under
+    max_bytes by evicting the least recently used files, whichever backend
+    wrote them.
+    """
+
+    def __init__(self, folder, max_bytes=200 * 1024 * 1024, backend=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.backend = backend or GTTSBackend()
+        self.synthesize = self.backend.synthesize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Event for syntheses in progress
+        self._entries = OrderedDict()  # filename -> size, oldest first
+        self._pinned = set()  # filenames that are never evicted
+        self._total_bytes = 0
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU order from the files already on disk."""
+        found = []
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if not self.owns(name) or name.endswith(".tmp"):
+                    continue
+                key = os.path.splitext(name)[0][len(CACHE_PREFIX) :]
+                filename = shard(key, name)
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.folder).replace(os.sep, "/") != filename:
+                    continue  # flat file from before sharding, see audio_store.py
+                st = os.stat(path)
+                found.append((st.st_mtime, filename, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def key(self, text, lang="en", tld="com", slow=False):
+        parts = [text, lang, tld, "1" if slow else "0"]
+        # gTTS keys predate backends; leave them as they were so existing
+        # caches and manifests stay valid
+        if self.backend.name != "gtts":
+            parts.append(self.backend.name)
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def filename_for(self, key):
+        return shard(key, f"{CACHE_PREFIX}{key}{self.backend.extension}")
+
+    @staticmethod
+    def owns(filename):
+        """True if filename is managed by the cache (and so may be shared)."""
+        return bool(filename) and os.path.basename(filename).startswith(CACHE_PREFIX)
+
+    def lookup(self, text, lang="en", tld="com", slow=False):
+        """Return the cached filename for text, or None without synthesizing."""
+        filename = self.filename_for(self.key(text, lang, tld, slow))
+        path = os.path.join(self.folder, filename)
+        with self._lock:
+            if filename in self._entries and os.path.exists(path):
+                self.hits += 1
+                self._touch(filename, path)
+                return filename
+        return None
+
+    def get(self, text, lang="en", tld="com", slow=False):
+        """
+        Return the cached filename for text, synthesizing it on a miss.
+        Raises whatever the synthesizer raises if it fails.
+        """
+        filename = self.filename_for(self.key(text, lang, tld, slow))
+        path = os.path.join(self.folder, filename)
+
+        while True:
+            with self._lock:
+                if filename in self._entries and os.path.exists(path):
+                    self.hits += 1
+                    self._touch(filename, path)
+                    return filename
+                waiter = self._inflight.get(filename)
+                if waiter is None:
+                    # We are the one synthesizing this key
+                    self.misses += 1
+                    self._inflight[filename] = threading.Event()
+                    break
+            # Another thread is rendering the same text; wait and re-check
+            waiter.wait()
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # _inflight only covers this process: other workers may be
+            # rendering the same text, so each render gets its own file
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+            os.close(fd)
+            try:
+                self.synthesize(text, tmp_path, lang=lang, tld=tld, slow=slow)
+                os.replace(tmp_path, path)
+            except Exception:
+                self.errors += 1
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            with self._lock:
+                self._add(filename, os.path.getsize(path))
+            return filename
+        finally:
+            with self._lock:
+                self._inflight.pop(filename).set()
+
+    def _touch(self, filename, path):
+        self._entries.move_to_end(filename)
+        try:
+            # Persist recency so the LRU order survives a restart
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _add(self, filename, size):
+        self._total_bytes -= self._entries.pop(filename, 0)
+        self._entries[filename] = size
+        self._total_bytes += size
+        self._evict()
+
+    def pin(self, filenames):
+        """Exclude filenames (e.g. the pre-built domain bundle) from eviction."""
+        with self._lock:
+            self._pinned.update(filenames)
+
+    def _evict(self):
+        candidates = [f for f in self._entries if f not in self._pinned]
+        # Oldest first; always keep the entry that was just added
+        for filename in candidates[:-1]:
+            if self._total_bytes <= self.max_bytes:
+                break
+            size = self._entries.pop(filename)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "pinned": len(self._pinned),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }